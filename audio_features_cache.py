@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from pagination import DEFAULT_WORKERS
+
+
+# Audio features of a track never change, so once fetched they are cached forever.
+AUDIO_FEATURES = (
+    'acousticness', 'danceability', 'duration_ms', 'energy', 'instrumentalness', 'key',
+    'liveness', 'loudness', 'mode', 'speechiness', 'tempo', 'time_signature', 'valence'
+)
+
+# Maximum amount of track IDs per audio features request.
+MAX_IDS_PER_REQUEST = 100
+# Keep well below SQLite's bound parameter limit.
+MAX_IDS_PER_QUERY = 500
+
+
+def create_tables(connection):
+    columns = "".join(f'{feature} REAL, ' for feature in AUDIO_FEATURES)
+    with connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS audio_features ('
+            'track_id TEXT PRIMARY KEY, '
+            'available INTEGER NOT NULL, '  # 0 when Spotify has no audio features for the track.
+            f'{columns}'
+            'fetched_at TEXT DEFAULT CURRENT_TIMESTAMP)'
+        )
+
+
+def _row_to_values(row):
+    track_id, available, *values = row
+    if not available:
+        return None
+
+    return tuple(values)
+
+
+def _features_to_row(track_id, features):
+    if not features:
+        return (track_id, 0) + (None,) * len(AUDIO_FEATURES)
+
+    return (track_id, 1) + tuple(features.get(feature) for feature in AUDIO_FEATURES)
+
+
+def load_cached_features(connection, track_ids):
+    track_ids = list(track_ids)
+    columns = ", ".join(AUDIO_FEATURES)
+    cached = {}
+    for i in range(0, len(track_ids), MAX_IDS_PER_QUERY):
+        chunk = track_ids[i:i + MAX_IDS_PER_QUERY]
+        rows = connection.execute(
+            f'SELECT track_id, available, {columns} FROM audio_features '
+            f'WHERE track_id IN ({", ".join("?" * len(chunk))})',
+            chunk
+        )
+        for row in rows:
+            cached[row[0]] = _row_to_values(row)
+
+    return cached
+
+
+def get_audio_features(spotify_client, connection, track_ids, workers=DEFAULT_WORKERS):
+    # Returns audio feature values ordered as AUDIO_FEATURES (or None) for every given track ID,
+    # in the same order, requesting only those tracks that have never been seen before.
+    create_tables(connection)
+
+    unique_ids = list(dict.fromkeys(track_ids))
+    values_by_id = load_cached_features(connection, unique_ids)
+    to_request = [track_id for track_id in unique_ids if track_id not in values_by_id]
+
+    if to_request:
+        print(f"Requesting audio features for {len(to_request)} tracks not found in the cache.")
+        chunks = [to_request[i:i + MAX_IDS_PER_REQUEST] for i in range(0, len(to_request), MAX_IDS_PER_REQUEST)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            responses = list(executor.map(lambda chunk: spotify_client.audio_features(tracks=chunk), chunks))
+
+        rows = []
+        for chunk, response in zip(chunks, responses):
+            if not response:
+                raise Exception("Failed to load audio features.")
+            for track_id, features in zip(chunk, response):
+                rows.append(_features_to_row(track_id, features))
+                values_by_id[track_id] = _row_to_values(rows[-1])
+
+        with connection:
+            connection.executemany(
+                f'INSERT OR REPLACE INTO audio_features (track_id, available, {", ".join(AUDIO_FEATURES)}) '
+                f'VALUES ({", ".join("?" * (len(AUDIO_FEATURES) + 2))})',
+                rows
+            )
+
+    return [values_by_id[track_id] for track_id in track_ids]
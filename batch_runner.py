@@ -0,0 +1,147 @@
+import argparse
+import importlib
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from spotify_api import create_spotify_client, create_authorization, create_http_adapter, ACCESS_TOKEN
+from metrics import DEFAULT_METRICS, Metrics
+
+
+# Scripts that can be run as jobs. Every one of them has get_args(argv) and
+# main(args, spotify_client, current_user, metrics) that runs the script in the calling thread.
+SCRIPTS = (
+    'liked_by_album_released_years',
+    'by_audio_features',
+    'merge_playlists',
+    'delete_tracks_from_all_playlists',
+)
+
+DEFAULT_JOBS = 4
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Runs playlist scripts for many users concurrently in a single process.',
+        add_help=True
+    )
+    parser.add_argument('job_file',
+                        help='JSON file with a list of jobs, e.g. '
+                        '[{"user": "alice", "script": "merge_playlists", "args": ["<playlist ID>", "<playlist ID>"]}]. '
+                        'Required.')
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS,
+                        help=f'Amount of jobs to run concurrently. Default: {DEFAULT_JOBS}.')
+    parser.add_argument('--metrics-json', type=str,
+                        help='Write the outcome and request, stage and run metrics of every job as JSON into this file.')
+    return parser.parse_args()
+
+
+def load_jobs(path):
+    with open(path) as file:
+        jobs = json.load(file)
+    if not isinstance(jobs, list) or not jobs:
+        raise Exception("The job file has to contain a list of jobs.")
+
+    loaded = []
+    for number, job in enumerate(jobs, start=1):
+        script = str(job.get('script', '')).removesuffix('.py')
+        if script not in SCRIPTS:
+            raise Exception(f"Job {number}: unknown script {job.get('script')!r}, expected one of: {', '.join(SCRIPTS)}.")
+        if not job.get('user'):
+            raise Exception(f"Job {number}: a user is required.")
+        loaded.append({
+            'name': job.get('name') or f"{number}-{job['user']}-{script}",
+            'user': str(job['user']),
+            'script': script,
+            'args': [str(arg) for arg in job.get('args', ())],
+        })
+
+    return loaded
+
+
+class UserSessions:
+    # Authorizes every user once and loads their profile once, no matter how many jobs they have.
+    # Tokens are cached per user in .cache-<user>, users without a cached token are asked to authorize.
+
+    def __init__(self, scope, adapter):
+        self.scope = scope
+        self.adapter = adapter
+        self._lock = threading.Lock()
+        self._users = {}
+
+    def _user(self, user):
+        with self._lock:
+            return self._users.setdefault(user, {'lock': threading.Lock(), 'authorization': None, 'profile': None})
+
+    def client_and_profile(self, user, metrics):
+        state = self._user(user)
+        with state['lock']:
+            if state['authorization'] is None and not ACCESS_TOKEN:
+                state['authorization'] = create_authorization(self.scope, username=user)
+            spotify_client = create_spotify_client(
+                self.scope, metrics=metrics, adapter=self.adapter, authorization=state['authorization']
+            )
+            if state['profile'] is None:
+                state['profile'] = spotify_client.me()
+
+        return spotify_client, state['profile']
+
+
+def run_job(job, module, sessions):
+    # Failures are caught here, so that a failing job does not affect the other ones.
+    metrics = Metrics()
+    result = {'name': job['name'], 'user': job['user'], 'script': job['script'], 'error': None}
+    started = time.perf_counter()
+    print(f"[{job['name']}] Started.")
+    try:
+        args = module.get_args(job['args'])
+        spotify_client, current_user = sessions.client_and_profile(job['user'], metrics)
+        module.main(args, spotify_client=spotify_client, current_user=current_user, metrics=metrics)
+    except SystemExit as error:
+        # Raised by argparse for invalid arguments, the usage is already printed.
+        result['error'] = f"Invalid arguments (exit code {error.code})."
+    except Exception as error:
+        traceback.print_exc()
+        result['error'] = f"{type(error).__name__}: {error}"
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    result['metrics'] = metrics.to_dict()
+    print(f"[{job['name']}] " + (f"Failed: {result['error']}" if result['error'] else "Done.")
+          + f" ({result['seconds']} s)")
+    return result
+
+
+def main(args):
+    if args.jobs < 1:
+        raise Exception("Atleast one concurrent job is required.")
+
+    jobs = load_jobs(args.job_file)
+    modules = {script: importlib.import_module(script) for script in {job['script'] for job in jobs}}
+    # One authorization per user covers every script the user has jobs for.
+    scope = " ".join(sorted({
+        permission for module in modules.values() for permission in module.PERMISSIONS_SCOPE.split()
+    }))
+
+    # Every job has its own client, but all of them send requests over the same connection pool
+    # and through the same request scheduler, so the rate limit is shared too.
+    sessions = UserSessions(scope, create_http_adapter())
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(lambda job: run_job(job, modules[job['script']], sessions), jobs))
+
+    failed = [result for result in results if result['error']]
+    print(f"Done. Jobs succeeded: {len(results) - len(failed)}, failed: {len(failed)}")
+    for result in failed:
+        print(f"Failed: {result['name']} - {result['error']}")
+
+    if args.metrics_json:
+        with open(args.metrics_json, 'w') as file:
+            # Scheduler retries and rate limit waits are shared by all jobs, so they are only in the batch metrics.
+            json.dump({'batch': DEFAULT_METRICS.to_dict(), 'jobs': results}, file, indent=2)
+
+    return not failed
+
+
+if __name__ == '__main__':
+    if not main(get_args()):
+        raise SystemExit(1)
@@ -0,0 +1,400 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+
+# A local stand-in for the parts of the Spotify Web API that the scripts use.
+# All data is synthetic and generated deterministically from the seed.
+
+USER_ID = 'benchmark_user'
+OTHER_USER_ID = 'someone_else'
+ACCESS_TOKEN = 'benchmark-token'
+
+AUDIO_FEATURES = (
+    'acousticness', 'danceability', 'energy', 'instrumentalness',
+    'liveness', 'speechiness', 'valence'
+)
+
+
+def track_id(number):
+    return f'track{number:017d}'
+
+
+def track_number(spotify_id):
+    return int(spotify_id[5:])
+
+
+def parse_fields(text):
+    # Parses the Spotify fields syntax, e.g. "items(track(id,name)),next" into a nested dict.
+    tree, stack, name = {}, [], ''
+    node = tree
+    for char in text + ',':
+        if char == '(':
+            child = {}
+            node[name.strip()] = child
+            stack.append(node)
+            node, name = child, ''
+        elif char == ')':
+            if name.strip():
+                node[name.strip()] = None
+            node, name = stack.pop(), ''
+        elif char == ',':
+            if name.strip():
+                node[name.strip()] = None
+            name = ''
+        else:
+            name += char
+
+    return tree
+
+
+def project(value, fields):
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    if isinstance(value, dict):
+        return {key: project(value[key], sub_fields) for key, sub_fields in fields.items() if key in value}
+
+    return value
+
+
+class MockLibrary:
+
+    def __init__(self, tracks=1000, playlists=50, playlist_size=200, seed=0):
+        self.track_count = tracks
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.next_playlist = 0
+        self.playlists = {}
+
+        rng = random.Random(seed)
+        for i in range(playlists):
+            owner = OTHER_USER_ID if i % 10 == 9 else USER_ID
+            size = min(tracks, playlist_size)
+            self.add_playlist(f'Benchmark playlist {i}', owner, [track_id(n) for n in rng.sample(range(tracks), size)])
+
+    def add_playlist(self, name, owner, track_ids, description=''):
+        with self.lock:
+            playlist_id = f'playlist{self.next_playlist:014d}'
+            self.next_playlist += 1
+            self.playlists[playlist_id] = {
+                'id': playlist_id,
+                'name': name,
+                'description': description,
+                'owner': {'id': owner, 'display_name': owner},
+                'snapshot_version': 0,
+                'tracks': list(track_ids),
+            }
+            return playlist_id
+
+    def track(self, number):
+        rng = random.Random(self.seed * 1_000_003 + number)
+        year = rng.randint(1950, 2024)
+        date_format = rng.random()
+        if date_format < 0.8:
+            release_date = f'{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+        elif date_format < 0.9:
+            release_date = f'{year}-{rng.randint(1, 12):02d}'
+        else:
+            release_date = str(year)
+
+        artist_number = rng.randint(0, max(1, self.track_count // 10))
+        return {
+            'id': track_id(number),
+            'name': f'Track {number}',
+            'uri': f'spotify:track:{track_id(number)}',
+            'duration_ms': rng.randint(90_000, 420_000),
+            'popularity': rng.randint(0, 100),
+            'artists': [{'id': f'artist{artist_number:016d}', 'name': f'Artist {artist_number}', 'type': 'artist'}],
+            'album': {
+                'id': f'album{number:017d}',
+                'name': f'Album {number}',
+                'release_date': release_date,
+                'release_date_precision': 'day',
+                # Bulky fields that a real response contains too.
+                'images': [{'url': f'https://i.scdn.co/image/{number}-{size}', 'height': size, 'width': size}
+                           for size in (640, 300, 64)],
+                'available_markets': ['LV', 'LT', 'EE', 'SE', 'FI', 'DE', 'GB', 'US'],
+            },
+            'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id(number)}'},
+            'available_markets': ['LV', 'LT', 'EE', 'SE', 'FI', 'DE', 'GB', 'US'],
+        }
+
+    def audio_features(self, number):
+        if number >= self.track_count:
+            return None
+
+        rng = random.Random(self.seed * 1_000_033 + number)
+        features = {feature: round(rng.random(), 4) for feature in AUDIO_FEATURES}
+        features.update({
+            'id': track_id(number),
+            'duration_ms': rng.randint(90_000, 420_000),
+            'key': rng.randint(0, 11),
+            'mode': rng.randint(0, 1),
+            'loudness': round(rng.uniform(-30, 0), 3),
+            'tempo': round(rng.uniform(60, 200), 3),
+            'time_signature': rng.choice((3, 4, 4, 4, 5)),
+        })
+        return features
+
+    def snapshot_id(self, playlist):
+        return f"{playlist['id']}-{playlist['snapshot_version']}"
+
+    def playlist_summary(self, playlist):
+        return {
+            'id': playlist['id'],
+            'name': playlist['name'],
+            'description': playlist['description'],
+            'owner': playlist['owner'],
+            'snapshot_id': self.snapshot_id(playlist),
+            'tracks': {'total': len(playlist['tracks'])},
+        }
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Set on the subclass created by create_server.
+    library = None
+    latency = 0.0
+    rate_limit_probability = 0.0
+    retry_after = 1
+    stats = None
+    stats_lock = None
+    random = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def record(self, endpoint, status, size):
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            self.stats[f'{self.command} {endpoint}'] += 1
+            self.stats[f'status {status}'] += 1
+            self.stats['bytes_sent'] += size
+
+    def send_json(self, endpoint, data, status=200, headers=None):
+        body = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.record(endpoint, status, len(body))
+
+    def send_error_json(self, endpoint, status, message, headers=None):
+        self.send_json(endpoint, {'error': {'status': status, 'message': message}}, status, headers)
+
+    def read_body(self):
+        # The body is read before any early response, an unread body would corrupt the next keep-alive request.
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+
+    def read_json(self):
+        return json.loads(self.body) if self.body else None
+
+    def page(self, path, items, query, total):
+        limit = int(query.get('limit', ['20'])[0])
+        offset = int(query.get('offset', ['0'])[0])
+
+        def link(new_offset):
+            params = {key: values[0] for key, values in query.items()}
+            params.update(limit=limit, offset=new_offset)
+            return f'http://{self.headers["Host"]}{path}?{urlencode(params)}'
+
+        return {
+            'href': link(offset),
+            'items': items(offset, min(total, offset + limit)),
+            'limit': limit,
+            'offset': offset,
+            'total': total,
+            'next': link(offset + limit) if offset + limit < total else None,
+            'previous': link(max(0, offset - limit)) if offset > 0 else None,
+        }
+
+    def handle_request(self):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/')
+        query = parse_qs(url.query)
+        endpoint = re.sub(r'/(playlist|track|user)s?/[^/]+', lambda m: m.group(0).rsplit('/', 1)[0] + '/{id}', path)
+        self.read_body()
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.headers.get('Authorization') != f'Bearer {ACCESS_TOKEN}':
+            return self.send_error_json(endpoint, 401, 'Invalid access token')
+        if self.rate_limit_probability and self.random.random() < self.rate_limit_probability:
+            return self.send_error_json(endpoint, 429, 'API rate limit exceeded',
+                                        headers={'Retry-After': str(self.retry_after)})
+
+        library = self.library
+        method = self.command
+
+        if method == 'GET' and path == '/v1/me':
+            return self.send_json(endpoint, {
+                'id': USER_ID, 'display_name': 'Benchmark User', 'type': 'user', 'country': 'LV'
+            })
+
+        if method == 'GET' and path == '/v1/me/tracks':
+            total = library.track_count
+            # Newest first, the last generated track was added most recently.
+            items = lambda start, end: [
+                {'added_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1_600_000_000 + total - i)),
+                 'track': library.track(total - 1 - i)}
+                for i in range(start, end)
+            ]
+            return self.send_json(endpoint, self.page(path, items, query, total))
+
+        if method == 'GET' and path == '/v1/me/playlists':
+            with library.lock:
+                summaries = [library.playlist_summary(playlist) for playlist in library.playlists.values()]
+            return self.send_json(endpoint, self.page(path, lambda s, e: summaries[s:e], query, len(summaries)))
+
+        if method == 'GET' and path == '/v1/audio-features':
+            ids = [i for i in query.get('ids', [''])[0].split(',') if i]
+            if len(ids) > 100:
+                return self.send_error_json(endpoint, 400, 'Too many ids requested')
+            return self.send_json(endpoint, {'audio_features': [library.audio_features(track_number(i)) for i in ids]})
+
+        match = re.fullmatch(r'/v1/users/([^/]+)/playlists', path)
+        if method == 'POST' and match:
+            payload = self.read_json() or {}
+            playlist_id = library.add_playlist(payload.get('name', ''), USER_ID, [], payload.get('description', ''))
+            with library.lock:
+                summary = library.playlist_summary(library.playlists[playlist_id])
+            return self.send_json(endpoint, summary, status=201)
+
+        match = re.fullmatch(r'/v1/playlists/([^/]+)(/tracks)?', path)
+        if not match or match.group(1) not in library.playlists:
+            return self.send_error_json(endpoint, 404, 'Not found')
+
+        playlist = library.playlists[match.group(1)]
+        fields = parse_fields(query['fields'][0]) if 'fields' in query else None
+
+        if not match.group(2):
+            if method != 'GET':
+                return self.send_error_json(endpoint, 405, 'Method not allowed')
+            with library.lock:
+                data = library.playlist_summary(playlist)
+                track_ids = list(playlist['tracks'])
+            data['tracks'] = {'total': len(track_ids), 'items': [
+                {'track': library.track(track_number(i))} for i in track_ids[:100]
+            ]}
+            return self.send_json(endpoint, project(data, fields))
+
+        if method == 'GET':
+            with library.lock:
+                track_ids = list(playlist['tracks'])
+            items = lambda start, end: [
+                {'added_at': '2020-01-01T00:00:00Z', 'track': library.track(track_number(i))}
+                for i in track_ids[start:end]
+            ]
+            return self.send_json(endpoint, project(self.page(path, items, query, len(track_ids)), fields))
+
+        payload = self.read_json()
+        if method == 'POST':
+            uris = payload if isinstance(payload, list) else (payload or {}).get('uris', [])
+            if len(uris) > 100:
+                return self.send_error_json(endpoint, 400, 'Too many tracks')
+            new_ids = [uri.rsplit(':', 1)[-1] for uri in uris]
+            position = query.get('position')
+            with library.lock:
+                if position:
+                    index = int(position[0])
+                    playlist['tracks'][index:index] = new_ids
+                else:
+                    playlist['tracks'].extend(new_ids)
+                playlist['snapshot_version'] += 1
+                snapshot_id = library.snapshot_id(playlist)
+            return self.send_json(endpoint, {'snapshot_id': snapshot_id}, status=201)
+
+        if method == 'DELETE':
+            tracks = payload.get('tracks', [])
+            if len(tracks) > 100:
+                return self.send_error_json(endpoint, 400, 'Too many tracks')
+            with library.lock:
+                if payload.get('snapshot_id') and payload['snapshot_id'] != library.snapshot_id(playlist):
+                    # Spotify applies removals against the given snapshot, the mock only supports the latest one.
+                    return self.send_error_json(endpoint, 400, 'Snapshot ID is outdated')
+                removed = {track['uri'].rsplit(':', 1)[-1] for track in tracks}
+                playlist['tracks'] = [i for i in playlist['tracks'] if i not in removed]
+                playlist['snapshot_version'] += 1
+                snapshot_id = library.snapshot_id(playlist)
+            return self.send_json(endpoint, {'snapshot_id': snapshot_id})
+
+        if method == 'PUT':
+            if 'uris' not in (payload or {}):
+                return self.send_error_json(endpoint, 400, 'Only replacing playlist items is supported')
+            with library.lock:
+                playlist['tracks'] = [uri.rsplit(':', 1)[-1] for uri in payload['uris']]
+                playlist['snapshot_version'] += 1
+                snapshot_id = library.snapshot_id(playlist)
+            return self.send_json(endpoint, {'snapshot_id': snapshot_id}, status=201)
+
+        return self.send_error_json(endpoint, 405, 'Method not allowed')
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+
+def create_server(library, host='127.0.0.1', port=0, latency=0.0, rate_limit_probability=0.0, retry_after=1, seed=0):
+    handler = type('ConfiguredMockSpotifyHandler', (MockSpotifyHandler,), {
+        'library': library,
+        'latency': latency,
+        'rate_limit_probability': rate_limit_probability,
+        'retry_after': retry_after,
+        'stats': Counter(),
+        'stats_lock': threading.Lock(),
+        'random': random.Random(seed),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = handler.stats
+    server.stats_lock = handler.stats_lock
+    server.api_url = f'http://{host}:{server.server_port}/v1/'
+    return server
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Runs a local mock Spotify Web API server.', add_help=True)
+    parser.add_argument('-t', '--tracks', type=int, default=1000,
+                        help='Amount of liked songs in the synthetic library. Default: 1000.')
+    parser.add_argument('-p', '--playlists', type=int, default=50,
+                        help='Amount of playlists in the synthetic library. Default: 50.')
+    parser.add_argument('-s', '--playlist-size', type=int, default=200,
+                        help='Amount of tracks per playlist. Default: 200.')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port to listen on. Default: 8765.')
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='Seconds to wait before answering each request. Default: 0.')
+    parser.add_argument('-r', '--rate-limit-probability', type=float, default=0.0,
+                        help='Probability of answering a request with 429 Too Many Requests. Default: 0.')
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help='Retry-After seconds sent with 429 responses. Default: 1.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    server = create_server(
+        MockLibrary(args.tracks, args.playlists, args.playlist_size),
+        port=args.port,
+        latency=args.latency,
+        rate_limit_probability=args.rate_limit_probability,
+        retry_after=args.retry_after
+    )
+    print(f"Mock Spotify API listening on {server.api_url}")
+    print(f"Use: SPOTIFY_API_URL={server.api_url} SPOTIFY_ACCESS_TOKEN={ACCESS_TOKEN}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Requests served: {dict(server.stats)}")
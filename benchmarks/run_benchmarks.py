@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from mock_spotify_server import MockLibrary, create_server, track_id, ACCESS_TOKEN, USER_ID
+
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+MERGED_PLAYLISTS = 5
+DELETED_TRACKS = 3
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='Runs the playlist scripts against a local mock Spotify API and reports their performance.',
+        add_help=True
+    )
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Liked songs library sizes to benchmark. Default: 1000 10000 100000.')
+    parser.add_argument('-p', '--playlists', type=int, default=50,
+                        help='Amount of playlists in each synthetic library. Default: 50.')
+    parser.add_argument('--playlist-size', type=int, default=200,
+                        help='Amount of tracks per playlist. Default: 200.')
+    parser.add_argument('-l', '--latency', type=float, default=0.05,
+                        help='Seconds the mock server waits before answering each request. Default: 0.05.')
+    parser.add_argument('-r', '--rate-limit-probability', type=float, default=0.0,
+                        help='Probability of the mock server answering with 429 Too Many Requests. Default: 0.')
+    parser.add_argument('--request-rate', type=float, default=1000.0,
+                        help='Request rate limit of the scripts\' scheduler, per second. Default: 1000.')
+    parser.add_argument('--scripts', nargs='+',
+                        help='Only run these scripts (e.g. by_audio_features.py). Default: all.')
+    parser.add_argument('--timeout', type=float, default=1800.0,
+                        help='Seconds after which a single script run is stopped. Default: 1800.')
+    parser.add_argument('-j', '--json', type=str,
+                        help='Also write the results as JSON into this file.')
+    return parser.parse_args()
+
+
+def scripts_to_run(library):
+    playlist_ids = [
+        playlist_id for playlist_id, playlist in library.playlists.items()
+        if playlist['owner']['id'] == USER_ID
+    ]
+    deleted = [track_id(n) for n in range(0, library.track_count, max(1, library.track_count // DELETED_TRACKS))]
+
+    # Deleting changes the library, so it goes last.
+    return (
+        ('liked_by_album_released_years.py', ['-s', '1990', '-e', '1999']),
+        ('by_audio_features.py', ['-t', '120', '-mv', '0.6']),
+        ('merge_playlists.py', playlist_ids[:MERGED_PLAYLISTS]),
+        ('delete_tracks_from_all_playlists.py', deleted[:DELETED_TRACKS]),
+    )
+
+
+def run_script(server, script, script_args, working_dir, request_rate, timeout):
+    env = dict(
+        os.environ,
+        SPOTIFY_API_URL=server.api_url,
+        SPOTIFY_ACCESS_TOKEN=ACCESS_TOKEN,
+        SPOTIFY_REQUEST_RATE=str(request_rate),
+    )
+    with server.stats_lock:
+        requests_before = server.stats['requests']
+        bytes_before = server.stats['bytes_sent']
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPOSITORY_DIR, script)] + list(script_args),
+        cwd=working_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    # Drain stderr in the background, os.wait4 is used instead of communicate() to get the resource usage.
+    stderr_chunks = []
+    reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    reader.start()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - started
+    timer.cancel()
+    reader.join()
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    with server.stats_lock:
+        requests = server.stats['requests'] - requests_before
+        bytes_sent = server.stats['bytes_sent'] - bytes_before
+
+    if process.returncode != 0:
+        print(f"{script} failed with exit code {process.returncode}:", file=sys.stderr)
+        print(stderr_chunks[0].decode(errors='replace')[-2000:], file=sys.stderr)
+
+    return {
+        'script': script,
+        'exit_code': process.returncode,
+        'wall_time_s': round(wall_time, 3),
+        'requests': requests,
+        'bytes_received': bytes_sent,
+        'peak_memory_mb': round(usage.ru_maxrss / 1024, 1),  # ru_maxrss is in kilobytes on Linux.
+    }
+
+
+def main(args):
+    results = []
+    header = f"{'tracks':>8} {'script':<38} {'cache':<5} {'wall s':>8} {'requests':>9} {'MB recv':>8} {'peak MB':>8}"
+    print(header)
+    print('-' * len(header))
+
+    for size in args.sizes:
+        library = MockLibrary(size, args.playlists, args.playlist_size)
+        server = create_server(library, latency=args.latency, rate_limit_probability=args.rate_limit_probability)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            for script, script_args in scripts_to_run(library):
+                if args.scripts and script not in args.scripts:
+                    continue
+                # Every script gets its own working directory, so its first run starts with an empty local cache
+                # (rather than one filled by the scripts before it) and only its second run reuses it.
+                with tempfile.TemporaryDirectory() as working_dir:
+                    for cache in ('cold', 'warm'):
+                        result = run_script(server, script, script_args, working_dir, args.request_rate, args.timeout)
+                        result.update(tracks=size, cache=cache)
+                        results.append(result)
+                        print(f"{size:>8} {script:<38} {cache:<5} {result['wall_time_s']:>8.2f} "
+                              f"{result['requests']:>9} {result['bytes_received'] / 1e6:>8.2f} "
+                              f"{result['peak_memory_mb']:>8.1f}" + ("" if result['exit_code'] == 0 else "  FAILED"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    return results
+
+
+if __name__ == '__main__':
+    main(get_args())
@@ -1,21 +1,66 @@
 import argparse
-import spotipy
-import secrets as user_secrets
-from spotipy.oauth2 import SpotifyOAuth
-
-
-PERMISSIONS_SCOPE = 'user-library-read playlist-modify-public'
-
-FILTERS_AND_ARGS = None
-
-# Track stats
-FILTERED, ADDED, SKIPPED = 0, 0, 0
-
-
-def get_args():
-    parser = argparse.ArgumentParser(description='Creates a playlist for user.', add_help=True)
+import json
+from collections import namedtuple
+from itertools import compress
+from spotify_api import create_spotify_client
+from pagination import DEFAULT_WORKERS
+from local_cache import open_cache, DEFAULT_CACHE_PATH
+from library_cache import sync_saved_tracks, load_saved_track_ids
+from playlist_cache import get_playlists_track_ids
+from audio_features_cache import get_audio_features
+from feature_filter import compile_filters, features_to_matrix, evaluate_filters
+from pipeline import run_pipeline
+from playlist_sync import sync_playlist, MAX_TRACKS_PER_REQUEST
+from run_journal import RunJournal, committed_tracks, add_resume_argument
+from metrics import DEFAULT_METRICS, add_metrics_arguments
+
+
+PERMISSIONS_SCOPE = 'user-library-read playlist-modify-public playlist-modify-private'
+
+# Arguments that change how the script runs, rather than which tracks are added.
+RUN_ARGS = (
+    'workers', 'cache_path', 'quiet', 'target_playlist', 'config', 'resume', 'metrics_json', 'metrics_prometheus'
+)
+
+# Arguments that choose the seed tracks of the similarity mode, rather than filter the tracks.
+SIMILARITY_ARGS = ('similar_to', 'similar_to_playlist', 'similar_count')
+
+# Amount of tracks that are filtered at once.
+CHUNK_SIZE = 1000
+# Amount of tracks that the similarity mode adds by default.
+DEFAULT_SIMILAR_COUNT = 50
+
+# A playlist to generate: its name, filter flags (e.g. {'min_tempo': 120}) and an optional playlist to sync instead.
+PlaylistSpec = namedtuple('PlaylistSpec', ('name', 'filters', 'target_playlist'))
+
+
+def get_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Creates a playlist for user.', add_help=True)
     parser.add_argument('-p', '--playlist-id', type=str,
                         help='Specify a custom playlist ID, instead of using liked songs playlist.')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Amount of requests to send concurrently. Default: {DEFAULT_WORKERS}.')
+    parser.add_argument('-c', '--cache-path', type=str, default=DEFAULT_CACHE_PATH,
+                        help=f'Path of the local liked songs, playlist and audio features cache database. '
+                        f'Default: {DEFAULT_CACHE_PATH}.')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Do not print every added track.')
+    parser.add_argument('--target-playlist', type=str,
+                        help='Rather than creating a new playlist, make this existing playlist contain exactly '
+                        'the filtered tracks. Only the differences are written.')
+    parser.add_argument('--config', type=str,
+                        help='JSON file with a list of playlists to generate in a single pass, each with a name, '
+                        'filters and an optional target playlist, e.g. [{"name": "Workout", '
+                        '"filters": {"min_tempo": 120, "min_energy": 0.7}}]. Replaces the filter flags.')
+    parser.add_argument('--similar-to', type=str, nargs='+',
+                        help='Seed track IDs. Adds the tracks with the most similar audio features to these tracks, '
+                        'instead of all tracks that pass the filters. Filter flags still limit the candidates.')
+    parser.add_argument('--similar-to-playlist', type=str,
+                        help='Playlist ID, whose tracks are used as seed tracks, like --similar-to.')
+    parser.add_argument('-n', '--similar-count', type=int,
+                        help=f'Amount of similar tracks to add. Default: {DEFAULT_SIMILAR_COUNT}.')
+    add_resume_argument(parser)
+    add_metrics_arguments(parser)
     # Argument descriptions source:
     # https://developer.spotify.com/documentation/web-api/reference/tracks/get-several-audio-features/
     parser.add_argument('-a', '--min-acousticness', type=float,
@@ -27,8 +72,8 @@ def get_args():
                         help='Min. value. Danceability describes how suitable a track is for dancing based on a '
                         'combination of musical elements including tempo, rhythm stability, beat strength, '
                         'and overall regularity. A value of 0.0 is least danceable and 1.0 is most danceable.')
-    parser.add_argument('-md', '--max-dancebillity', type=float,
-                        help='Max. value for dancebillity.')
+    parser.add_argument('-md', '--max-danceability', type=float,
+                        help='Max. value for danceability.')
     parser.add_argument('-du', '--min-duration_ms', type=int,
                         help='Min. value. The duration of the track in milliseconds.')
     parser.add_argument('-mdu', '--max-duration_ms', type=int,
@@ -92,128 +137,269 @@ def get_args():
     parser.add_argument('-mv', '--max-valence', type=float,
                         help='Max. value for valence.')
 
-    return parser.parse_args()
-
-
-def track_should_be_added(track_audio_features):
-    if not track_audio_features:
-        return False
-
-    for key, value in FILTERS_AND_ARGS.items():
-        split_filter_key = key.split("_")  # e.g. min_tempo.
-        try:  # Get the actual audio feature value that was received.
-            actual_value = track_audio_features[split_filter_key[1]]
-        except KeyError:
-            return False  # TODO: Maybe rather continue?
-
-        if split_filter_key[0] == "min":
-            if actual_value < value:
-                return False
-        elif split_filter_key[0] == "max":
-            if actual_value > value:
-                return False
-
-    return True
-
-
-def filter_tracks_to_list(to_add, results):
-    global FILTERED, SKIPPED
-
-    for track_audio_features in results:
-        FILTERED += 1
-        if track_should_be_added(track_audio_features):
-            print(f"Adding: {track_audio_features['id']}")
-            to_add.append(track_audio_features['id'])
-        else:
-            SKIPPED += 1
-
-
-def request_audio_features(spotify_client, results):
-    to_request = [x['track']['id'] for x in results['items'] if x['track']['id'] is not None]
-    if to_request:
-        return spotify_client.audio_features(tracks=to_request)
-
-    return None
-
-
-def main():
-    global FILTERED, ADDED, SKIPPED
-
-    try:
-        custom_playlist_id = FILTERS_AND_ARGS['playlist_id']
-    except KeyError:
-        custom_playlist_id = False
-
-    # TODO: If there would be more options that are not filters, this should be reworked.
-    if not FILTERS_AND_ARGS or len(FILTERS_AND_ARGS) == 1 and custom_playlist_id:
-        raise Exception("Usage of atleast one filter is required to generate the playlist.")
-
-    authorization = SpotifyOAuth(
-        scope=PERMISSIONS_SCOPE,
-        client_id=user_secrets.CLIENT_ID,
-        client_secret=user_secrets.CLIENT_SECRET,
-        redirect_uri=user_secrets.REDIRECT_URI,
-        open_browser=False
-    )
-    spotify_client = spotipy.Spotify(auth_manager=authorization)
-    current_user = spotify_client.me()
+    return parser.parse_args(argv)
+
+
+def load_config(path):
+    with open(path) as file:
+        config = json.load(file)
+    if not isinstance(config, list) or not config:
+        raise Exception("The config file has to contain a list of playlists.")
+
+    specs = []
+    for number, playlist in enumerate(config, start=1):
+        if not isinstance(playlist, dict) or not playlist.get('name'):
+            raise Exception(f"Playlist {number} of the config file has no name.")
+        filters = playlist.get('filters')
+        if not filters:
+            raise Exception(f"Playlist {playlist['name']} of the config file has no filters.")
+        if not isinstance(filters, dict):
+            raise Exception(f"Playlist {playlist['name']} of the config file has to have its filters as an object.")
+        for key, value in filters.items():
+            # bool is an int too, but true or false is no bound.
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise Exception(f"Playlist {playlist['name']} of the config file has a non-numeric {key} filter.")
+        target_playlist = playlist.get('target_playlist')
+        if target_playlist is not None and (not isinstance(target_playlist, str) or not target_playlist):
+            raise Exception(f"Playlist {playlist['name']} of the config file has no valid target playlist ID.")
+        specs.append(PlaylistSpec(playlist['name'], filters, target_playlist))
+
+    return specs
+
+
+def filter_tracks_to_lists(to_add_lists, track_ids, feature_rows, compiled_filters, quiet=False):
+    # The feature matrix of a chunk is built once and evaluated for every filter at once, rather than per track
+    # and per filter. Returns the amount of tracks that were not added to any list.
+    masks = evaluate_filters(compiled_filters, features_to_matrix(feature_rows))
+    for to_add, mask in zip(to_add_lists, masks):
+        added = list(compress(track_ids, mask))
+        if not quiet:
+            for track_id in added:
+                print(f"Adding: {track_id}")
+
+        to_add.extend(added)
+
+    return int((~masks.any(axis=0)).sum())
+
+
+def similar_tracks_to_list(to_add, track_ids, feature_rows, seed_track_ids, seed_feature_rows, count,
+                           compiled_filter, quiet=False):
+    # Only tracks that pass the filter flags are indexed, the seed tracks themselves are never added.
+    # Returns the amount of skipped tracks.
+    # scipy takes longer to import than everything else together, so it is only imported for the similarity mode.
+    from similarity import SimilarityIndex
+
+    mask = evaluate_filters([compiled_filter], features_to_matrix(feature_rows))[0]
+    index = SimilarityIndex(list(compress(track_ids, mask)), list(compress(feature_rows, mask)))
+    added = index.nearest(seed_feature_rows, count, exclude=seed_track_ids)
+    if not quiet:
+        for track_id in added:
+            print(f"Adding: {track_id}")
+
+    to_add.extend(added)
+    return len(track_ids) - len(added)
+
+
+def main(args, spotify_client=None, current_user=None, metrics=DEFAULT_METRICS):
+    # Remove args where value is None.
+    filters_and_args = {
+        key: value for key, value in vars(args).items() if value is not None and key not in RUN_ARGS
+    }
+    custom_playlist_id = filters_and_args.get('playlist_id')
+    workers = args.workers
+
+    filters = {
+        key: value for key, value in filters_and_args.items() if key != 'playlist_id' and key not in SIMILARITY_ARGS
+    }
+    seed_track_ids = list(args.similar_to or ())
+    similar = bool(seed_track_ids or args.similar_to_playlist)
+    similar_count = DEFAULT_SIMILAR_COUNT if args.similar_count is None else args.similar_count
+    if args.config:
+        if filters or args.target_playlist or similar:
+            raise Exception("Filters and target playlists have to be set in the config file when it is used.")
+        specs = load_config(args.config)
+    else:
+        if not filters and not similar:
+            raise Exception("Usage of atleast one filter is required to generate the playlist.")
+        specs = [PlaylistSpec("My similar tracks" if similar else "My filtered playlist", filters, args.target_playlist)]
+    if similar_count < 1:
+        raise Exception("Atleast one similar track has to be added.")
+    compiled_filters = [compile_filters(spec.filters) for spec in specs]
+    if workers < 1:
+        raise Exception("Atleast one worker is required.")
+
+    # The batch runner passes in a shared client and an already loaded profile.
+    spotify_client = spotify_client or create_spotify_client(PERMISSIONS_SCOPE, metrics=metrics)
+    current_user = current_user or spotify_client.me()
     if not spotify_client or not current_user:
         raise Exception("Failed to authorize app client or user.")
 
     print(f"Authorized as: {current_user['display_name']}")
 
-    used_flags = "".join(f"{filter}:{value}, " for filter, value in FILTERS_AND_ARGS.items())
-    print(f"Using audio feature flags: {used_flags[:-2]}")
-
-    created_playlist = spotify_client.user_playlist_create(
-        user=current_user['id'],
-        name="My filtered playlist",
-        description="Automatically generated with https://github.com/fuzzysearch404/SpotifyPlaylistScripts"
-        f" | Used flags: {used_flags[:-2]}."[:300]  # Description char limit: 300
+    journal = RunJournal(
+        args.cache_path, 'by_audio_features', current_user['id'],
+        [filters_and_args, [list(spec) for spec in specs]], args.resume
     )
-    if not created_playlist:
-        raise Exception("Failed to create a playlist.")
 
-    print(f"Playlist created. ID:{created_playlist['id']}")
-
-    if not custom_playlist_id:
-        print("No playlist ID provided - defaulting to saved (liked) tracks")
-        results = spotify_client.current_user_saved_tracks(limit=50)
+    # Playlist IDs to add the filtered tracks to, None for the ones that are synced at the end.
+    # A resumed run continues with the playlists that it already created.
+    playlist_ids = journal.get('playlist_ids', [])
+    for spec in specs[len(playlist_ids):]:
+        used_flags = "".join(
+            f"{filter}:{value}, " for filter, value in dict(spec.filters, **filters_and_args).items()
+        )
+        print(f"{spec.name} - using audio feature flags: {used_flags[:-2]}")
+        if spec.target_playlist:
+            playlist_ids.append(None)
+            journal.checkpoint(playlist_ids=playlist_ids)
+            continue
+
+        created_playlist = spotify_client.user_playlist_create(
+            user=current_user['id'],
+            name=spec.name,
+            description="Automatically generated with https://github.com/fuzzysearch404/SpotifyPlaylistScripts"
+            f" | Used flags: {used_flags[:-2]}."[:300]  # Description char limit: 300
+        )
+        if not created_playlist:
+            raise Exception("Failed to create a playlist.")
+
+        print(f"Playlist created. ID:{created_playlist['id']}")
+        playlist_ids.append(created_playlist['id'])
+        journal.checkpoint(playlist_ids=playlist_ids)
+
+    cache_connection = open_cache(args.cache_path)
+    # Amount of filtered tracks that were added to each created playlist. Tracks are only appended to them,
+    # so a resumed run skips that many filtered tracks. A batch that was sent, but not journaled, is
+    # noticed from the size of the playlist.
+    written = journal.get('written', [0] * len(specs))
+    if journal.resumed:
+        written = [
+            committed_tracks(spotify_client, playlist_id, count) if playlist_id else 0
+            for playlist_id, count in zip(playlist_ids, written)
+        ]
+        if any(written):
+            print(f"Tracks already added by the previous run: {sum(written)}")
+
+    # A resumed run continues with the tracks of the previous run. The cache may have been synced by
+    # another run since, and the already written tracks are skipped by their position.
+    track_ids = journal.load('track_ids')
+    if track_ids is None:
+        with metrics.stage('fetch'):
+            if not custom_playlist_id:
+                print("No playlist ID provided - defaulting to saved (liked) tracks")
+                sync_saved_tracks(spotify_client, cache_connection, current_user['id'], workers=workers)
+                track_ids = load_saved_track_ids(cache_connection, current_user['id'])
+            else:
+                print(f"Using custom playlist. ID: {custom_playlist_id}")
+                track_ids = get_playlists_track_ids(
+                    spotify_client, cache_connection, [custom_playlist_id], workers=workers
+                )[0]
+        journal.store('track_ids', track_ids)
+    journal.checkpoint(written=written)
+
+    id_chunks = (track_ids[i:i + CHUNK_SIZE] for i in range(0, len(track_ids), CHUNK_SIZE))
+    filtered, added, skipped, removed = 0, 0, 0, 0
+
+    # The stages below run concurrently: looking up audio features and writing
+    # to the playlists only block each other when the queue between them is full.
+    def filter_stage(chunks):
+        nonlocal filtered, skipped
+
+        for chunk_ids in chunks:
+            to_add_lists = [[] for _ in specs]
+            with metrics.stage('audio_features'):
+                feature_rows = get_audio_features(spotify_client, cache_connection, chunk_ids, workers=workers)
+            with metrics.stage('filter'):
+                skipped += filter_tracks_to_lists(to_add_lists, chunk_ids, feature_rows, compiled_filters, args.quiet)
+            filtered += len(chunk_ids)
+            yield to_add_lists
+
+    def add_tracks_to_spotify_playlist(index, batch):
+        nonlocal added
+
+        print(f"Sending a request to Spotify to add {len(batch)} tracks.")
+        with metrics.stage('write'):
+            spotify_client.playlist_add_items(playlist_ids[index], batch)
+        added += len(batch)
+        written[index] += len(batch)
+        journal.checkpoint(written=written)
+
+    # The target playlists can only be diffed once every filtered track is known, so their tracks are collected.
+    desired = [[] for _ in specs]
+
+    # Filtered tracks that are already in the created playlists.
+    to_skip = list(written)
+
+    def write_stage(filtered_chunks):
+        for to_add_lists in filtered_chunks:
+            for index, (playlist_id, to_add, filtered_ids) in enumerate(zip(playlist_ids, desired, to_add_lists)):
+                if playlist_id and to_skip[index]:
+                    skipped_ids = filtered_ids[:to_skip[index]]
+                    filtered_ids = filtered_ids[len(skipped_ids):]
+                    to_skip[index] -= len(skipped_ids)
+                to_add.extend(filtered_ids)
+                # Only full batches are sent until the end.
+                while playlist_id and len(to_add) >= MAX_TRACKS_PER_REQUEST:
+                    add_tracks_to_spotify_playlist(index, to_add[:MAX_TRACKS_PER_REQUEST])
+                    del to_add[:MAX_TRACKS_PER_REQUEST]
+
+        for index, (playlist_id, to_add) in enumerate(zip(playlist_ids, desired)):
+            if playlist_id and to_add:
+                add_tracks_to_spotify_playlist(index, to_add)
+
+        return ()
+
+    if similar:
+        # Every track has to be indexed before the closest ones are known, so nothing is streamed here.
+        if args.similar_to_playlist:
+            seed_playlist_track_ids = journal.load('seed_playlist_track_ids')
+            if seed_playlist_track_ids is None:
+                with metrics.stage('fetch'):
+                    seed_playlist_track_ids = get_playlists_track_ids(
+                        spotify_client, cache_connection, [args.similar_to_playlist], workers=workers
+                    )[0]
+                journal.store('seed_playlist_track_ids', seed_playlist_track_ids)
+            seed_track_ids += seed_playlist_track_ids
+        with metrics.stage('audio_features'):
+            feature_rows = get_audio_features(spotify_client, cache_connection, track_ids, workers=workers)
+            seed_feature_rows = get_audio_features(spotify_client, cache_connection, seed_track_ids, workers=workers)
+        with metrics.stage('filter'):
+            skipped = similar_tracks_to_list(
+                desired[0], track_ids, feature_rows, seed_track_ids, seed_feature_rows, similar_count,
+                compiled_filters[0], args.quiet
+            )
+        filtered = len(track_ids)
+        if playlist_ids[0]:
+            for i in range(written[0], len(desired[0]), MAX_TRACKS_PER_REQUEST):
+                add_tracks_to_spotify_playlist(0, desired[0][i:i + MAX_TRACKS_PER_REQUEST])
     else:
-        print(f"Using custom playlist. ID: {custom_playlist_id}")
-        results = spotify_client.playlist_items(custom_playlist_id, limit=50) 
+        run_pipeline(id_chunks, filter_stage, write_stage)
 
-    if not results:
+    if not filtered:
         raise Exception("Failed to load playlist or playlist has no songs.")
 
-    to_add = []
-
-    def add_tracks_to_spotify_playlist():
-        print(f"Sending a request to Spotify to add {len(to_add)} tracks.")
-        spotify_client.playlist_add_items(created_playlist['id'], to_add)
-
-    filter_tracks_to_list(to_add, request_audio_features(spotify_client, results))
-    while results['next']:
-        results = spotify_client.next(results)
-        filter_tracks_to_list(to_add, request_audio_features(spotify_client, results))
-
-        # Limit list of songs to be added at a time to about 50 from max 100.
-        if len(to_add) >= 50:
-            add_tracks_to_spotify_playlist()
-            ADDED += len(to_add)
-            to_add = []
-
-    if len(to_add) > 0:
-        add_tracks_to_spotify_playlist()
-        ADDED += len(to_add)
+    for spec, to_add in zip(specs, desired):
+        if spec.target_playlist:
+            with metrics.stage('write'):
+                synced_removed, synced_added = sync_playlist(
+                    spotify_client, cache_connection, spec.target_playlist, to_add, workers=workers
+                )
+            removed += synced_removed
+            added += synced_added
 
+    journal.finish()
     print("Done.")
-    print(f"Filtered: {FILTERED}, Added: {ADDED}, Skipped: {SKIPPED}")
+    print(f"Filtered: {filtered}, Added: {added}, Skipped: {skipped}, Removed: {removed}")
+    metrics.record_counters(
+        tracks_filtered=filtered, tracks_added=added, tracks_skipped=skipped, tracks_removed=removed,
+        playlists_written=len(specs)
+    )
 
 
 if __name__ == '__main__':
     args = get_args()
-    # Remove args where value is None.
-    FILTERS_AND_ARGS = dict([x for x in args.__dict__.items() if x[1] is not None])
 
-    main()
+    try:
+        main(args)
+    finally:
+        DEFAULT_METRICS.export(args.metrics_json, args.metrics_prometheus)
@@ -1,66 +1,125 @@
 import argparse
-import spotipy
-import secrets as user_secrets
-from spotipy.oauth2 import SpotifyOAuth
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from spotify_api import create_spotify_client
+from pagination import iterate_items, DEFAULT_WORKERS
+from local_cache import open_cache, DEFAULT_CACHE_PATH
+from playlist_cache import refresh_playlists, playlists_containing, remove_from_cached_playlist
+from playlist_sync import MAX_TRACKS_PER_REQUEST
+from metrics import DEFAULT_METRICS, add_metrics_arguments
+from run_journal import RunJournal, add_resume_argument
 
 
 PERMISSIONS_SCOPE = 'user-library-read playlist-modify-public playlist-modify-private'
 
-TRACK_IDS = None
-IGNORE_PLAYLIST_IDS = None
 
-
-def get_args():
-    parser = argparse.ArgumentParser(description='Deletes songs from all user playlists.', add_help=True)
+def get_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Deletes songs from all user playlists.', add_help=True)
     parser.add_argument('track_ids', nargs='+',
                         help='Track IDs of the track that will be removed from all your playlists. Required.')
     parser.add_argument('-i', '--ignore-playlists', nargs='+',
                         help='Playlist IDs of playlists that will be ignored.')
-    return parser.parse_args()
-
-
-def main():
-    if not TRACK_IDS:
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Amount of playlists to download or modify concurrently. Default: {DEFAULT_WORKERS}.')
+    parser.add_argument('-c', '--cache-path', type=str, default=DEFAULT_CACHE_PATH,
+                        help=f'Path of the local playlist cache database. Default: {DEFAULT_CACHE_PATH}.')
+    add_resume_argument(parser)
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(args, spotify_client=None, current_user=None, metrics=DEFAULT_METRICS):
+    track_ids, ignore_playlist_ids, workers = args.track_ids, args.ignore_playlists or (), args.workers
+    if not track_ids:
         raise Exception("Atleast one track ID is required.")
+    if workers < 1:
+        raise Exception("Atleast one worker is required.")
 
-    authorization = SpotifyOAuth(
-        scope=PERMISSIONS_SCOPE,
-        client_id=user_secrets.CLIENT_ID,
-        client_secret=user_secrets.CLIENT_SECRET,
-        redirect_uri=user_secrets.REDIRECT_URI,
-        open_browser=False
-    )
-    spotify_client = spotipy.Spotify(auth_manager=authorization)
-    current_user = spotify_client.me()
+    # The batch runner passes in a shared client and an already loaded profile.
+    spotify_client = spotify_client or create_spotify_client(PERMISSIONS_SCOPE, metrics=metrics)
+    current_user = current_user or spotify_client.me()
     if not spotify_client or not current_user:
         raise Exception("Failed to authorize app client or user.")
 
     print(f"Authorized as: {current_user['display_name']}")
 
-    user_playlists = spotify_client.current_user_playlists(limit=50)
-    if not user_playlists:
-        raise Exception("Failed to playlists or user has no playlists.")
-
-    def remove_track_from_playlists(playlists_data):
-        for playlist in playlists_data['items']:
-            if playlist['id'] in IGNORE_PLAYLIST_IDS:
+    journal = RunJournal(
+        args.cache_path, 'delete_tracks_from_all_playlists', current_user['id'],
+        [sorted(track_ids), sorted(ignore_playlist_ids)], args.resume
+    )
+    cache_connection = open_cache(args.cache_path)
+
+    # A resumed run already knows which playlists contain the tracks, so nothing is read again.
+    plan = journal.load('plan')
+    if plan is None:
+        with metrics.stage('fetch'):
+            user_playlists = list(iterate_items(
+                lambda limit, offset: spotify_client.current_user_playlists(limit=limit, offset=offset),
+                workers=workers
+            ))
+        if not user_playlists:
+            raise Exception("Failed to playlists or user has no playlists.")
+
+        owned_playlists = []
+        for playlist in user_playlists:
+            if playlist['id'] in ignore_playlist_ids:
                 print(f"Skipping playlist: {playlist['name']}")
                 continue
             if playlist['owner']['id'] == current_user['id']:
-                print(f"Removing tracks {TRACK_IDS} from playlist: {playlist['name']}")
-                spotify_client.playlist_remove_all_occurrences_of_items(playlist['id'], TRACK_IDS)
-
-    remove_track_from_playlists(user_playlists)
-    while user_playlists['next']:
-        user_playlists = spotify_client.next(user_playlists)
-        remove_track_from_playlists(user_playlists)
-
-    print("Done.")
+                owned_playlists.append(playlist)
+
+        # Only playlists that changed since the last run are downloaded to find out which ones contain the tracks.
+        with metrics.stage('fetch'):
+            refresh_playlists(spotify_client, cache_connection, owned_playlists, workers=workers)
+        with metrics.stage('filter'):
+            containing = playlists_containing(
+                cache_connection, (playlist['id'] for playlist in owned_playlists), track_ids
+            )
+        plan = {
+            'checked': len(owned_playlists),
+            'containing': {playlist_id: sorted(tracks) for playlist_id, tracks in containing.items()},
+            'names': {playlist['id']: playlist['name'] for playlist in owned_playlists if playlist['id'] in containing},
+        }
+        journal.store('plan', plan)
+        journal.checkpoint(done=[])
+
+    containing, names = plan['containing'], plan['names']
+    done = set(journal.get('done'))
+    if done:
+        print(f"Tracks were already removed from {len(done)} playlists.")
+
+    def remove_tracks_from_playlist(playlist_id):
+        to_remove = containing[playlist_id]
+        print(f"Removing tracks {to_remove} from playlist: {names[playlist_id]}")
+        snapshot_id = None
+        for i in range(0, len(to_remove), MAX_TRACKS_PER_REQUEST):
+            result = spotify_client.playlist_remove_all_occurrences_of_items(
+                playlist_id, to_remove[i:i + MAX_TRACKS_PER_REQUEST]
+            )
+            snapshot_id = result['snapshot_id']
+
+        return snapshot_id
+
+    with metrics.stage('write'), ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(remove_tracks_from_playlist, playlist_id): playlist_id
+            for playlist_id in containing if playlist_id not in done
+        }
+        # Every playlist is journaled as soon as its tracks are removed.
+        for future in as_completed(futures):
+            playlist_id = futures[future]
+            remove_from_cached_playlist(cache_connection, playlist_id, future.result(), set(containing[playlist_id]))
+            done.add(playlist_id)
+            journal.checkpoint(done=sorted(done))
+
+    journal.finish()
+    print(f"Done. Tracks removed from {len(containing)} out of {plan['checked']} playlists.")
+    metrics.record_counters(playlists_checked=plan['checked'], playlists_modified=len(containing))
 
 
 if __name__ == '__main__':
     args = get_args()
-    TRACK_IDS = args.track_ids
-    IGNORE_PLAYLIST_IDS = args.ignore_playlists or ()
 
-    main()
+    try:
+        main(args)
+    finally:
+        DEFAULT_METRICS.export(args.metrics_json, args.metrics_prometheus)
@@ -0,0 +1,55 @@
+from collections import namedtuple
+import numpy as np
+from audio_features_cache import AUDIO_FEATURES
+
+
+FEATURE_COLUMNS = {feature: column for column, feature in enumerate(AUDIO_FEATURES)}
+
+# Row used for tracks that have no audio features, NaN never passes any bound.
+MISSING_ROW = (None,) * len(AUDIO_FEATURES)
+
+CompiledFilter = namedtuple('CompiledFilter', ('columns', 'lower', 'upper'))
+
+
+def compile_filters(filters):
+    # Compiles flags like {'min_tempo': 120, 'max_duration_ms': 300000} into bound vectors
+    # over the filtered feature columns only.
+    lower = np.full(len(AUDIO_FEATURES), -np.inf)
+    upper = np.full(len(AUDIO_FEATURES), np.inf)
+    used_columns = set()
+
+    for key, value in filters.items():
+        bound, _, feature = key.partition("_")  # e.g. min_duration_ms -> min, duration_ms.
+        if bound not in ("min", "max") or feature not in FEATURE_COLUMNS:
+            raise Exception(f"Unknown audio feature filter: {key}")
+
+        column = FEATURE_COLUMNS[feature]
+        used_columns.add(column)
+        if bound == "min":
+            lower[column] = max(lower[column], value)
+        else:
+            upper[column] = min(upper[column], value)
+
+    columns = np.array(sorted(used_columns), dtype=np.intp)
+    return CompiledFilter(columns, lower[columns], upper[columns])
+
+
+def features_to_matrix(feature_rows):
+    # One row per track, one column per AUDIO_FEATURES entry. Missing values become NaN.
+    if not feature_rows:
+        return np.empty((0, len(AUDIO_FEATURES)))
+
+    return np.array([row or MISSING_ROW for row in feature_rows], dtype=np.float64)
+
+
+def evaluate_filter(compiled_filter, matrix):
+    values = matrix[:, compiled_filter.columns]
+    return np.all((values >= compiled_filter.lower) & (values <= compiled_filter.upper), axis=1)
+
+
+def evaluate_filters(compiled_filters, matrix):
+    # Evaluates every filter over the same matrix. Returns a boolean matrix with a row per filter and a column per track.
+    masks = np.empty((len(compiled_filters), len(matrix)), dtype=bool)
+    for row, compiled_filter in enumerate(compiled_filters):
+        masks[row] = evaluate_filter(compiled_filter, matrix)
+    return masks
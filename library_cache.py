@@ -0,0 +1,161 @@
+from pagination import iterate_pages, DEFAULT_WORKERS
+from tracks import Track
+
+
+# The saved tracks endpoint supports no fields projection, so every page is parsed into
+# compact Track records right away and the full JSON of the page is dropped.
+PAGE_LIMIT = 50
+
+
+def create_tables(connection):
+    with connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS saved_tracks ('
+            'user_id TEXT NOT NULL, '
+            'track_id TEXT NOT NULL, '
+            'added_at TEXT NOT NULL, '
+            'name TEXT, '
+            'artist_name TEXT, '
+            'artist_ids TEXT, '  # Comma separated.
+            'release_date TEXT, '
+            'PRIMARY KEY (user_id, track_id))'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS saved_tracks_added_at ON saved_tracks (user_id, added_at)'
+        )
+        # Progress of an unfinished full download, so that an interrupted download continues from the last stored page.
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS saved_tracks_download ('
+            'user_id TEXT PRIMARY KEY, '
+            'signature TEXT NOT NULL, '  # Total and newest track, a changed library starts the download over.
+            'next_offset INTEGER NOT NULL)'
+        )
+
+
+def _insert_tracks(connection, user_id, tracks):
+    connection.executemany(
+        'INSERT OR REPLACE INTO saved_tracks VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (
+            (user_id, track.id, track.added_at, track.name, track.artist_name, track.artist_ids, track.release_date)
+            for track in tracks
+        )
+    )
+
+
+def _count_tracks(connection, user_id):
+    return connection.execute('SELECT COUNT(*) FROM saved_tracks WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+def _is_known(connection, user_id, track):
+    return connection.execute(
+        'SELECT 1 FROM saved_tracks WHERE user_id = ? AND track_id = ? AND added_at = ?',
+        (user_id, track.id, track.added_at)
+    ).fetchone() is not None
+
+
+def _download_signature(first_page):
+    newest = first_page['items'][0] if first_page['items'] else None
+    return f"{first_page['total']}:{newest['track']['id'] if newest else ''}:{newest['added_at'] if newest else ''}"
+
+
+def full_sync(spotify_client, connection, user_id, workers=DEFAULT_WORKERS):
+    create_tables(connection)
+    download = connection.execute(
+        'SELECT signature, next_offset FROM saved_tracks_download WHERE user_id = ?', (user_id,)
+    ).fetchone()
+
+    def start_offset(first_page):
+        signature = _download_signature(first_page)
+        if download and download[0] == signature:
+            print(f"Continuing an interrupted download of liked songs from track {download[1]}.")
+            return download[1]
+
+        with connection:
+            connection.execute('DELETE FROM saved_tracks WHERE user_id = ?', (user_id,))
+            connection.execute('INSERT OR REPLACE INTO saved_tracks_download VALUES (?, ?, 0)', (user_id, signature))
+        return 0
+
+    pages = iterate_pages(
+        lambda limit, offset: spotify_client.current_user_saved_tracks(limit=limit, offset=offset),
+        limit=PAGE_LIMIT,
+        workers=workers,
+        start_offset=start_offset
+    )
+    # Every page is stored together with the offset of the next one.
+    for page in pages:
+        with connection:
+            _insert_tracks(connection, user_id, (
+                Track.from_item(item) for item in page['items'] if item['track']['id']
+            ))
+            connection.execute(
+                'UPDATE saved_tracks_download SET next_offset = ? WHERE user_id = ?',
+                (page['offset'] + PAGE_LIMIT, user_id)
+            )
+
+    with connection:
+        connection.execute('DELETE FROM saved_tracks_download WHERE user_id = ?', (user_id,))
+
+    return _count_tracks(connection, user_id)
+
+
+def sync_saved_tracks(spotify_client, connection, user_id, workers=DEFAULT_WORKERS):
+    create_tables(connection)
+
+    if not _count_tracks(connection, user_id):
+        print("Library cache is empty - downloading all liked songs")
+        return full_sync(spotify_client, connection, user_id, workers=workers)
+
+    # Saved tracks are returned newest first, so new tracks are only
+    # expected until the first track that is already in the cache.
+    new_tracks, offset, total = [], 0, 0
+    while True:
+        results = spotify_client.current_user_saved_tracks(limit=PAGE_LIMIT, offset=offset)
+        if not results:
+            raise Exception("Failed to load liked songs.")
+
+        total = results['total']
+        reached_known = False
+        for item in results['items']:
+            if not item['track']['id']:
+                continue
+            track = Track.from_item(item)
+            if _is_known(connection, user_id, track):
+                reached_known = True
+                break
+            new_tracks.append(track)
+
+        if reached_known or not results['next']:
+            break
+        offset += PAGE_LIMIT
+
+    with connection:
+        _insert_tracks(connection, user_id, new_tracks)
+
+    # Every new track was added above, so any difference from the total
+    # means that some tracks were removed since the last sync.
+    cached = _count_tracks(connection, user_id)
+    if cached != total:
+        print("Liked songs were removed since the last sync - downloading all liked songs")
+        return full_sync(spotify_client, connection, user_id, workers=workers)
+
+    print(f"Library cache synced. New liked songs: {len(new_tracks)}")
+    return cached
+
+
+def load_saved_tracks(connection, user_id):
+    create_tables(connection)
+    rows = connection.execute(
+        'SELECT track_id, name, artist_name, artist_ids, release_date, added_at FROM saved_tracks '
+        'WHERE user_id = ? ORDER BY added_at DESC',
+        (user_id,)
+    )
+    return [Track(*row) for row in rows]
+
+
+def load_saved_track_ids(connection, user_id):
+    # Same order as load_saved_tracks, without building a record for every track.
+    create_tables(connection)
+    rows = connection.execute(
+        'SELECT track_id FROM saved_tracks WHERE user_id = ? ORDER BY added_at DESC', (user_id,)
+    )
+    return [track_id for track_id, in rows]
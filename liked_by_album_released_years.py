@@ -1,78 +1,82 @@
 import argparse
-import spotipy
-import secrets as user_secrets
-from spotipy.oauth2 import SpotifyOAuth
-
-
-PERMISSIONS_SCOPE = 'user-library-read playlist-modify-public'
-
-START_YEAR, END_YEAR = -1, -1
-
-# Track stats
-FILTERED, ADDED, SKIPPED = 0, 0, 0
-
-
-def get_args():
-    parser = argparse.ArgumentParser(description='Creates a playlist for user.', add_help=True)
-    parser.add_argument('-s', '--start-year', required=True, type=int,
-                        help='Starting release year for liked songs to filter. Required.')
-    parser.add_argument('-e', '--end-year', required=True, type=int,
-                        help='Ending release year for liked songs to filter. Required.')
-    return parser.parse_args()
-
-
-def track_should_be_added(track):
-    album = track['album']
-    date_unparsed = album["release_date"]
-
-    try:
-        year = int(date_unparsed.split("-")[0]) # Expected formats: 2020-01-01, 2020-01, 2020
-    except Exception:
-        return False
-
-    return year >= START_YEAR and year <= END_YEAR
-
-
-def filter_tracks_to_list(to_add, results):
-    global FILTERED, SKIPPED
-
-    for item in results['items']:
-        FILTERED += 1
-        track = item['track']
-        if track_should_be_added(track):
-            print("Adding: %32.32s %s" % (track['artists'][0]['name'], track['name']))
-            to_add.append(track['id'])
-        else:
-            SKIPPED += 1
-
-
-def main():
-    global FILTERED, ADDED, SKIPPED
-
-    if START_YEAR < 0 or END_YEAR < 0:
-        raise Exception("Only positive year integers are allowed.")
-    if START_YEAR > 2100 or END_YEAR > 2100:
-        raise Exception("I think that we are not there yet, buddy.")
-    if START_YEAR > END_YEAR:
-        raise Exception("End year cannot be greater than start year.")
-
-    authorization = SpotifyOAuth(
-        scope=PERMISSIONS_SCOPE,
-        client_id=user_secrets.CLIENT_ID,
-        client_secret=user_secrets.CLIENT_SECRET,
-        redirect_uri=user_secrets.REDIRECT_URI,
-        open_browser=False
-    )
-    spotify_client = spotipy.Spotify(auth_manager=authorization)
-    current_user = spotify_client.me()
-    if not spotify_client or not current_user:
-        raise Exception("Failed to authorize app client or user.")
-
-    print(f"Authorized as: {current_user['display_name']}")
+from spotify_api import create_spotify_client
+from pagination import DEFAULT_WORKERS
+from local_cache import open_cache, DEFAULT_CACHE_PATH
+from library_cache import sync_saved_tracks, load_saved_tracks
+from playlist_sync import sync_playlist, MAX_TRACKS_PER_REQUEST
+from year_index import ReleaseYearIndex
+from metrics import DEFAULT_METRICS, add_metrics_arguments
+
+
+PERMISSIONS_SCOPE = 'user-library-read playlist-modify-public playlist-modify-private'
+
+
+def year_range(text):
+    # Parses a range like 1990-1999, or a single year like 1990.
+    start_year, _, end_year = text.partition("-")
+    return int(start_year), int(end_year or start_year)
+
+
+def get_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Creates a playlist for user.', add_help=True)
+    parser.add_argument('-s', '--start-year', type=int,
+                        help='Starting release year for liked songs to filter. Required, unless --ranges or '
+                        '--decades is used.')
+    parser.add_argument('-e', '--end-year', type=int,
+                        help='Ending release year for liked songs to filter. Required, unless --ranges or '
+                        '--decades is used.')
+    parser.add_argument('-r', '--ranges', type=year_range, nargs='+',
+                        help='Create a playlist for each of these release year ranges, e.g. 1980-1989 1990-1999.')
+    parser.add_argument('-d', '--decades', action='store_true',
+                        help='Create a playlist for each decade of the liked songs.')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Amount of liked songs pages to request concurrently. Default: {DEFAULT_WORKERS}.')
+    parser.add_argument('-c', '--cache-path', type=str, default=DEFAULT_CACHE_PATH,
+                        help=f'Path of the local liked songs cache database. Default: {DEFAULT_CACHE_PATH}.')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Do not print every added track.')
+    parser.add_argument('--target-playlist', type=str, nargs='+',
+                        help='Rather than creating new playlists, make these existing playlists contain exactly '
+                        'the filtered tracks, one playlist per year range. Only the differences are written.')
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def requested_ranges(args):
+    # Returns the year ranges to create playlists for, or None if they are the decades of the library.
+    modes = sum((args.start_year is not None or args.end_year is not None, bool(args.ranges), args.decades))
+    if modes != 1:
+        raise Exception("Use either --start-year and --end-year, --ranges or --decades.")
+    if args.decades:
+        return None
+    if args.ranges:
+        ranges = args.ranges
+    else:
+        if args.start_year is None or args.end_year is None:
+            raise Exception("Both start year and end year are required.")
+        ranges = [(args.start_year, args.end_year)]
+
+    for start_year, end_year in ranges:
+        if start_year < 0 or end_year < 0:
+            raise Exception("Only positive year integers are allowed.")
+        if start_year > 2100 or end_year > 2100:
+            raise Exception("I think that we are not there yet, buddy.")
+        if start_year > end_year:
+            raise Exception("End year cannot be greater than start year.")
+
+    return ranges
+
+
+def write_playlist(spotify_client, cache_connection, current_user, start_year, end_year, track_ids,
+                   target_playlist=None, workers=DEFAULT_WORKERS):
+    # Returns the amount of added and removed tracks.
+    if target_playlist:
+        removed, added = sync_playlist(spotify_client, cache_connection, target_playlist, track_ids, workers=workers)
+        return added, removed
 
     created_playlist = spotify_client.user_playlist_create(
         user=current_user['id'],
-        name=f"My tracks {START_YEAR}-{END_YEAR}",
+        name=f"My tracks {start_year}-{end_year}",
         description="Automatically generated with https://github.com/fuzzysearch404/SpotifyPlaylistScripts"
     )
     if not created_playlist:
@@ -80,38 +84,77 @@ def main():
 
     print(f"Playlist created. ID:{created_playlist['id']}")
 
-    results = spotify_client.current_user_saved_tracks(limit=50)
-    if not results:
-        raise Exception("Failed to load liked songs or user has no liked songs.")
+    for i in range(0, len(track_ids), MAX_TRACKS_PER_REQUEST):
+        batch = track_ids[i:i + MAX_TRACKS_PER_REQUEST]
+        print(f"Sending a request to Spotify to add {len(batch)} tracks.")
+        spotify_client.playlist_add_items(created_playlist['id'], batch)
 
-    to_add = []
+    return len(track_ids), 0
 
-    def add_tracks_to_spotify_playlist():
-        print(f"Sending a request to Spotify to add {len(to_add)} tracks.")
-        spotify_client.playlist_add_items(created_playlist['id'], to_add)
 
-    filter_tracks_to_list(to_add, results)
-    while results['next']:
-        results = spotify_client.next(results)
-        filter_tracks_to_list(to_add, results)
+def main(args, spotify_client=None, current_user=None, metrics=DEFAULT_METRICS):
+    ranges = requested_ranges(args)
+    targets = args.target_playlist or ()
+    if ranges is not None and targets and len(targets) != len(ranges):
+        raise Exception("Exactly one target playlist is required for every year range.")
+    if args.workers < 1:
+        raise Exception("Atleast one worker is required.")
 
-        # Limit list of songs to be added at a time to about 50 from max 100.
-        if len(to_add) >= 50:
-            add_tracks_to_spotify_playlist()
-            ADDED += len(to_add)
-            to_add = []
+    # The batch runner passes in a shared client and an already loaded profile.
+    spotify_client = spotify_client or create_spotify_client(PERMISSIONS_SCOPE, metrics=metrics)
+    current_user = current_user or spotify_client.me()
+    if not spotify_client or not current_user:
+        raise Exception("Failed to authorize app client or user.")
 
-    if len(to_add) > 0:
-        add_tracks_to_spotify_playlist()
-        ADDED += len(to_add)
+    print(f"Authorized as: {current_user['display_name']}")
+
+    with metrics.stage('fetch'):
+        cache_connection = open_cache(args.cache_path)
+        sync_saved_tracks(spotify_client, cache_connection, current_user['id'], workers=args.workers)
+        saved_tracks = load_saved_tracks(cache_connection, current_user['id'])
+    if not saved_tracks:
+        raise Exception("Failed to load liked songs or user has no liked songs.")
 
+    # The library is indexed once, every range is then only a binary search away.
+    with metrics.stage('filter'):
+        index = ReleaseYearIndex(saved_tracks)
+        if ranges is None:
+            ranges = index.decades()
+            print(f"Liked songs are from {len(ranges)} decades.")
+            if targets and len(targets) != len(ranges):
+                raise Exception("Exactly one target playlist is required for every decade.")
+        selected = [index.tracks_between(start_year, end_year) for start_year, end_year in ranges]
+
+    added, removed, matched = 0, 0, set()
+    for (start_year, end_year), tracks, target in zip(ranges, selected, targets or [None] * len(ranges)):
+        print(f"Tracks from {start_year}-{end_year}: {len(tracks)}")
+        if not args.quiet:
+            for track in tracks:
+                print("Adding: %32.32s %s" % (track.artist_name, track.name))
+        track_ids = [track.id for track in tracks]
+        matched.update(track_ids)
+
+        with metrics.stage('write'):
+            range_added, range_removed = write_playlist(
+                spotify_client, cache_connection, current_user, start_year, end_year, track_ids,
+                target_playlist=target, workers=args.workers
+            )
+        added += range_added
+        removed += range_removed
+
+    filtered, skipped = len(saved_tracks), len(saved_tracks) - len(matched)
     print("Done.")
-    print(f"Filtered: {FILTERED}, Added: {ADDED}, Skipped: {SKIPPED}")
+    print(f"Filtered: {filtered}, Added: {added}, Skipped: {skipped}, Removed: {removed}")
+    metrics.record_counters(
+        tracks_filtered=filtered, tracks_added=added, tracks_skipped=skipped, tracks_removed=removed,
+        playlists_written=len(ranges)
+    )
 
 
 if __name__ == '__main__':
     args = get_args()
-    START_YEAR = args.start_year
-    END_YEAR = args.end_year
 
-    main()
+    try:
+        main(args)
+    finally:
+        DEFAULT_METRICS.export(args.metrics_json, args.metrics_prometheus)
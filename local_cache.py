@@ -0,0 +1,14 @@
+import sqlite3
+
+
+# All locally cached Spotify data is kept in a single SQLite database file.
+DEFAULT_CACHE_PATH = 'spotify_cache.sqlite3'
+# Seconds to wait for another connection's write to finish, e.g. of a concurrent batch job.
+BUSY_TIMEOUT = 60
+
+
+def open_cache(path=DEFAULT_CACHE_PATH):
+    # Connections may be handed over to worker threads, callers take care of not using them concurrently.
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    return connection
@@ -1,78 +1,119 @@
 import argparse
-import spotipy
-import secrets as user_secrets
-from spotipy.oauth2 import SpotifyOAuth
+from spotify_api import create_spotify_client
+from pagination import DEFAULT_WORKERS
+from local_cache import open_cache, DEFAULT_CACHE_PATH
+from playlist_cache import get_playlists_track_ids
+from playlist_sync import MAX_TRACKS_PER_REQUEST
+from metrics import DEFAULT_METRICS, add_metrics_arguments
+from run_journal import RunJournal, committed_tracks, add_resume_argument
 
 
 PERMISSIONS_SCOPE = "user-library-read playlist-modify-public playlist-modify-private"
 
-PLAYLIST_IDS = None
-APPEND_PLAYLIST_ID = None
 
-
-def get_args():
-    parser = argparse.ArgumentParser(description="Merges playlists, by creating a combined playlist", add_help=True)
+def get_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(
+        prog=prog, description="Merges playlists, by creating a combined playlist", add_help=True
+    )
     parser.add_argument("playlist_ids", nargs="+",
                         help="Playlist IDs of playlists to merge together. Required.")
     parser.add_argument("-a", "--append-playlist",
                         help="Rather than creating a new playlist for the merged playlists, append an existing one.")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Amount of playlists to read concurrently. Default: {DEFAULT_WORKERS}.")
+    parser.add_argument("-c", "--cache-path", type=str, default=DEFAULT_CACHE_PATH,
+                        help=f"Path of the local playlist cache database. Default: {DEFAULT_CACHE_PATH}.")
+    add_resume_argument(parser)
+    add_metrics_arguments(parser)
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
-def main():
-    if not PLAYLIST_IDS:
+def main(args, spotify_client=None, current_user=None, metrics=DEFAULT_METRICS):
+    playlist_ids, append_playlist_id = args.playlist_ids, args.append_playlist
+    if not playlist_ids:
         raise Exception("Atleast one playlist ID is required.")
+    if args.workers < 1:
+        raise Exception("Atleast one worker is required.")
 
-    authorization = SpotifyOAuth(
-        scope=PERMISSIONS_SCOPE,
-        client_id=user_secrets.CLIENT_ID,
-        client_secret=user_secrets.CLIENT_SECRET,
-        redirect_uri=user_secrets.REDIRECT_URI,
-        open_browser=False
-    )
-
-    spotify_client = spotipy.Spotify(auth_manager=authorization)
-    current_user = spotify_client.me()
+    # The batch runner passes in a shared client and an already loaded profile.
+    spotify_client = spotify_client or create_spotify_client(PERMISSIONS_SCOPE, metrics=metrics)
+    current_user = current_user or spotify_client.me()
     if not spotify_client or not current_user:
         raise Exception("Failed to authorize app client or user.")
 
     print(f"Authorized as: {current_user['display_name']}")
 
-    if not APPEND_PLAYLIST_ID:
+    journal = RunJournal(
+        args.cache_path, 'merge_playlists', current_user['id'], [playlist_ids, append_playlist_id], args.resume
+    )
+
+    if not append_playlist_id and not journal.get('created_playlist_id'):
         created_playlist = spotify_client.user_playlist_create(
             user=current_user['id'],
             name="My merged playlist",
             description="Automatically generated with https://github.com/fuzzysearch404/SpotifyPlaylistScripts"
-            f" | Merged from {len(PLAYLIST_IDS)} playlists"
+            f" | Merged from {len(playlist_ids)} playlists"
         )
         if not created_playlist:
             raise Exception("Failed to create a playlist.")
-        created_playlist_id = created_playlist['id']
-
-        print(f"Playlist created. ID:{created_playlist_id}")
-
-    resulting_playlist_id = APPEND_PLAYLIST_ID or created_playlist_id
-
-    def add_tracks(res):
-        to_add = [t['track']['id'] for t in res['items'] if t['track']['id'] is not None]
-        print(f"Sending a request to bulk insert {len(to_add)} tracks into the new playlist")
-        spotify_client.playlist_add_items(resulting_playlist_id, to_add)
-
-    for playlist_id in PLAYLIST_IDS:
-        results = spotify_client.playlist_items(playlist_id=playlist_id)
-        add_tracks(results)
-
-        while results['next']:
-            results = spotify_client.next(results)
-            add_tracks(results)
-
+        journal.checkpoint(created_playlist_id=created_playlist['id'])
+
+        print(f"Playlist created. ID:{created_playlist['id']}")
+
+    resulting_playlist_id = append_playlist_id or journal.get('created_playlist_id')
+
+    # A resumed run already knows what to add, so nothing is read again.
+    to_add = journal.load('to_add')
+    if to_add is None:
+        # Unchanged playlists are read from the local cache.
+        with metrics.stage('fetch'):
+            cache_connection = open_cache(args.cache_path)
+            to_read = list(playlist_ids) + ([append_playlist_id] if append_playlist_id else [])
+            sources = get_playlists_track_ids(spotify_client, cache_connection, to_read, workers=args.workers)
+
+        # Tracks that are already in the resulting playlist, or were already taken from a previous source.
+        seen = set()
+        base_total = 0
+        if append_playlist_id:
+            seen.update(sources.pop())
+            # The playlist's total also counts local and unavailable tracks, which have no IDs.
+            base_total = spotify_client.playlist(append_playlist_id, fields='tracks(total)')['tracks']['total']
+
+        to_add = []
+        for track_ids in sources:
+            for track_id in track_ids:
+                if track_id not in seen:
+                    seen.add(track_id)
+                    to_add.append(track_id)
+
+        skipped = sum(len(track_ids) for track_ids in sources) - len(to_add)
+        journal.store('to_add', to_add)
+        journal.checkpoint(skipped=skipped, base_total=base_total, written=0)
+    skipped = journal.get('skipped')
+    print(f"Merging {len(to_add)} tracks, skipping {skipped} duplicates.")
+
+    written = journal.get('written')
+    if journal.resumed:
+        written = committed_tracks(spotify_client, resulting_playlist_id, written, journal.get('base_total'))
+        print(f"{written} tracks were already added.")
+
+    with metrics.stage('write'):
+        for i in range(written, len(to_add), MAX_TRACKS_PER_REQUEST):
+            batch = to_add[i:i + MAX_TRACKS_PER_REQUEST]
+            print(f"Sending a request to bulk insert {len(batch)} tracks into the new playlist")
+            spotify_client.playlist_add_items(resulting_playlist_id, batch)
+            journal.checkpoint(written=i + len(batch))
+
+    journal.finish()
     print("Done.")
+    metrics.record_counters(tracks_added=len(to_add), duplicates_skipped=skipped)
 
 
 if __name__ == '__main__':
     args = get_args()
-    PLAYLIST_IDS = args.playlist_ids or ()
-    APPEND_PLAYLIST_ID = args.append_playlist
 
-    main()
+    try:
+        main(args)
+    finally:
+        DEFAULT_METRICS.export(args.metrics_json, args.metrics_prometheus)
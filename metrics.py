@@ -0,0 +1,173 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Upper bounds (in seconds) of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Path segments that are followed by an ID, e.g. playlists/<id>/tracks -> playlists/{id}/tracks.
+_ID_SEGMENT = re.compile(r'\b(playlists|users|tracks|albums|artists)/[^/?]+')
+
+
+def endpoint_name(method, url):
+    path = url.split('?', 1)[0].split('/v1/', 1)[-1].strip('/')
+    return method + " " + _ID_SEGMENT.sub(r'\1/{id}', path)
+
+
+class Metrics:
+    # Thread safe collection of per endpoint request statistics, stage timings and run counters.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.endpoints = {}
+        self.retries = {}
+        self.rate_limit_waits = 0
+        self.rate_limit_wait_seconds = 0.0
+        self.stages = {}
+        self.counters = {}
+
+    def record_response(self, method, url, status, seconds, size):
+        name = endpoint_name(method, url)
+        with self._lock:
+            endpoint = self.endpoints.setdefault(name, {
+                'requests': 0,
+                'errors': 0,
+                'bytes_received': 0,
+                'latency_seconds_sum': 0.0,
+                'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),  # The last bucket is +Inf.
+                'statuses': {},
+            })
+            endpoint['requests'] += 1
+            endpoint['errors'] += status >= 400
+            endpoint['bytes_received'] += size
+            endpoint['latency_seconds_sum'] += seconds
+            endpoint['latency_buckets'][_bucket_index(seconds)] += 1
+            endpoint['statuses'][str(status)] = endpoint['statuses'].get(str(status), 0) + 1
+
+    def record_retry(self, status):
+        with self._lock:
+            self.retries[str(status)] = self.retries.get(str(status), 0) + 1
+
+    def record_rate_limit_wait(self, seconds):
+        with self._lock:
+            self.rate_limit_waits += 1
+            self.rate_limit_wait_seconds += seconds
+
+    def record_counters(self, **counters):
+        with self._lock:
+            self.counters.update(counters)
+
+    @contextmanager
+    def stage(self, name):
+        # Durations of a stage are summed up, so a stage may be timed in several parts or threads.
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'duration_seconds': time.time() - self.started_at,
+                'requests': sum(endpoint['requests'] for endpoint in self.endpoints.values()),
+                'endpoints': {
+                    name: dict(endpoint, latency_buckets=dict(zip(_bucket_labels(), endpoint['latency_buckets'])))
+                    for name, endpoint in self.endpoints.items()
+                },
+                'retries': dict(self.retries),
+                'rate_limit_waits': self.rate_limit_waits,
+                'rate_limit_wait_seconds': self.rate_limit_wait_seconds,
+                'stage_seconds': dict(self.stages),
+                'counters': dict(self.counters),
+            }
+
+    def to_prometheus(self, prefix='spotify_playlist_scripts'):
+        data = self.to_dict()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f'{prefix}_{name}{{{label_text}}} {value}' if label_text else f'{prefix}_{name} {value}')
+
+        endpoints = data['endpoints'].items()
+        metric('requests_total', 'counter', 'Spotify API requests by endpoint and status.', [
+            ({'endpoint': name, 'status': status}, count)
+            for name, endpoint in endpoints for status, count in endpoint['statuses'].items()
+        ])
+        metric('received_bytes_total', 'counter', 'Response bytes received by endpoint.', [
+            ({'endpoint': name}, endpoint['bytes_received']) for name, endpoint in endpoints
+        ])
+
+        lines.append(f'# HELP {prefix}_request_duration_seconds Spotify API request latency by endpoint.')
+        lines.append(f'# TYPE {prefix}_request_duration_seconds histogram')
+        for name, endpoint in endpoints:
+            cumulative = 0
+            for label, count in endpoint['latency_buckets'].items():
+                cumulative += count
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{endpoint="{name}",le="{label}"}} {cumulative}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{endpoint="{name}"}} {endpoint["latency_seconds_sum"]}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{endpoint="{name}"}} {endpoint["requests"]}')
+
+        metric('retries_total', 'counter', 'Retried requests by response status.', [
+            ({'status': status}, count) for status, count in data['retries'].items()
+        ])
+        metric('rate_limit_waits_total', 'counter', 'Times the requests were paused for a 429 response.', [
+            ({}, data['rate_limit_waits'])
+        ])
+        metric('rate_limit_wait_seconds_total', 'counter', 'Seconds the requests were paused for 429 responses.', [
+            ({}, data['rate_limit_wait_seconds'])
+        ])
+        metric('stage_seconds', 'gauge', 'Seconds spent in each stage of the run.', [
+            ({'stage': stage}, seconds) for stage, seconds in data['stage_seconds'].items()
+        ])
+        metric('run_counter', 'gauge', 'Script specific counters of the run.', [
+            ({'name': name}, value) for name, value in data['counters'].items()
+        ])
+        metric('run_duration_seconds', 'gauge', 'Seconds since the metrics were created.', [
+            ({}, data['duration_seconds'])
+        ])
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path=None, prometheus_path=None):
+        if json_path:
+            with open(json_path, 'w') as file:
+                json.dump(self.to_dict(), file, indent=2)
+        if prometheus_path:
+            # Textfile collectors may read the file at any time, so it is replaced at once.
+            with open(prometheus_path + '.tmp', 'w') as file:
+                file.write(self.to_prometheus())
+            os.replace(prometheus_path + '.tmp', prometheus_path)
+
+
+def _bucket_index(seconds):
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            return index
+    return len(LATENCY_BUCKETS)
+
+
+def _bucket_labels():
+    return [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--metrics-json', type=str,
+                        help='Write request, stage and run metrics as JSON into this file.')
+    parser.add_argument('--metrics-prometheus', type=str,
+                        help='Write request, stage and run metrics into this Prometheus textfile.')
+
+
+DEFAULT_METRICS = Metrics()
@@ -0,0 +1,44 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Default amount of page requests that are allowed to be in flight at once.
+DEFAULT_WORKERS = 8
+
+
+def iterate_pages(request_page, limit=50, workers=DEFAULT_WORKERS, start_offset=None):
+    # request_page is any offset based Spotify endpoint, called as request_page(limit=..., offset=...).
+    # The first page is fetched on its own to read the total, then the rest
+    # of the offsets are requested concurrently and yielded in their original order.
+    # start_offset(first_page) may return an offset to continue from instead, e.g. where an interrupted
+    # download stopped. The pages before it are neither requested nor yielded.
+    first_page = request_page(limit=limit, offset=0)
+    if not first_page:
+        return
+
+    start = start_offset(first_page) if start_offset else 0
+    if not start:
+        yield first_page
+
+    offsets = range(max(start, limit), first_page['total'], limit)
+    if not offsets:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for offset in offsets:
+            pending.append(executor.submit(request_page, limit=limit, offset=offset))
+            # Keep a bounded window of requests ahead of the consumer.
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iterate_items(request_page, limit=50, workers=DEFAULT_WORKERS):
+    for page in iterate_pages(request_page, limit=limit, workers=workers):
+        yield from page['items']
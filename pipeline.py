@@ -0,0 +1,81 @@
+import queue
+import threading
+
+
+# Amount of items that may wait between two stages before the producing stage blocks.
+DEFAULT_QUEUE_SIZE = 4
+
+_DONE = object()
+_POLL_INTERVAL = 0.1
+
+
+class _Aborted(Exception):
+    # Raised in a stage waiting for input when another stage failed, so that it stops
+    # without running the code it has for the end of its input (e.g. flushing a last batch).
+    pass
+
+
+def run_pipeline(source, *stages, queue_size=DEFAULT_QUEUE_SIZE):
+    # Runs the source iterable and every stage in their own thread, connected by bounded queues.
+    # A stage is a function that takes an iterable of input items and returns (or yields)
+    # output items, so it can batch, filter or flush at the end as it likes.
+    # Output of the last stage is discarded. The first error stops all stages and is re-raised.
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    def put(target_queue, item):
+        while not stop.is_set():
+            try:
+                target_queue.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def consume(source_queue):
+        while True:
+            if stop.is_set():
+                raise _Aborted()
+            try:
+                item = source_queue.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def run(create_iterable, output_queue):
+        # The iterable is created in here, so errors of stages that are plain functions are caught too.
+        try:
+            for item in create_iterable():
+                if stop.is_set():
+                    return
+                if output_queue is not None and not put(output_queue, item):
+                    return
+        except _Aborted:
+            pass
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            if output_queue is not None:
+                put(output_queue, _DONE)
+
+    threads = [threading.Thread(target=run, args=(lambda: source, queues[0] if queues else None), daemon=True)]
+    for i, stage in enumerate(stages):
+        output_queue = queues[i + 1] if i + 1 < len(queues) else None
+        threads.append(threading.Thread(
+            target=lambda stage=stage, i=i, output_queue=output_queue: run(
+                lambda: stage(consume(queues[i])), output_queue
+            ),
+            daemon=True
+        ))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+from pagination import iterate_items, DEFAULT_WORKERS
+
+
+# Maximum amount of items per playlist items request.
+PAGE_LIMIT = 100
+# Only the track IDs and the total are read from playlist items, the rest of every item is left out of the response.
+PLAYLIST_ITEM_FIELDS = 'items(track(id)),total'
+# Keep well below SQLite's bound parameter limit.
+MAX_IDS_PER_QUERY = 500
+
+
+def create_tables(connection):
+    with connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS playlists ('
+            'playlist_id TEXT PRIMARY KEY, '
+            'snapshot_id TEXT NOT NULL)'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS playlist_tracks ('
+            'playlist_id TEXT NOT NULL, '
+            'position INTEGER NOT NULL, '
+            'track_id TEXT NOT NULL, '
+            'PRIMARY KEY (playlist_id, position))'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS playlist_tracks_track_id ON playlist_tracks (track_id)'
+        )
+
+
+def cached_snapshot_ids(connection, playlist_ids):
+    playlist_ids = list(playlist_ids)
+    snapshots = {}
+    for i in range(0, len(playlist_ids), MAX_IDS_PER_QUERY):
+        chunk = playlist_ids[i:i + MAX_IDS_PER_QUERY]
+        rows = connection.execute(
+            f'SELECT playlist_id, snapshot_id FROM playlists WHERE playlist_id IN ({", ".join("?" * len(chunk))})',
+            chunk
+        )
+        snapshots.update(rows)
+
+    return snapshots
+
+
+def store_playlist(connection, playlist_id, snapshot_id, track_ids):
+    with connection:
+        connection.execute('DELETE FROM playlist_tracks WHERE playlist_id = ?', (playlist_id,))
+        connection.executemany(
+            'INSERT INTO playlist_tracks VALUES (?, ?, ?)',
+            ((playlist_id, position, track_id) for position, track_id in enumerate(track_ids))
+        )
+        connection.execute('INSERT OR REPLACE INTO playlists VALUES (?, ?)', (playlist_id, snapshot_id))
+
+
+def load_cached_track_ids(connection, playlist_id):
+    return [
+        track_id for track_id, in connection.execute(
+            'SELECT track_id FROM playlist_tracks WHERE playlist_id = ? ORDER BY position', (playlist_id,)
+        )
+    ]
+
+
+def remove_from_cached_playlist(connection, playlist_id, snapshot_id, track_ids):
+    # Mirrors a successful removal of all occurrences of the tracks, so the playlist is not downloaded again.
+    remaining = [track_id for track_id in load_cached_track_ids(connection, playlist_id) if track_id not in track_ids]
+    store_playlist(connection, playlist_id, snapshot_id, remaining)
+
+
+def fetch_playlist_track_ids(spotify_client, playlist_id, workers=DEFAULT_WORKERS):
+    items = iterate_items(
+        lambda limit, offset: spotify_client.playlist_items(
+            playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=limit, offset=offset
+        ),
+        limit=PAGE_LIMIT,
+        workers=workers
+    )
+    # Local tracks have no IDs and removed tracks have no track at all.
+    return [item['track']['id'] for item in items if item['track'] and item['track']['id']]
+
+
+def refresh_playlists(spotify_client, connection, playlists, workers=DEFAULT_WORKERS):
+    # Downloads only the given playlists (as listed by current_user_playlists)
+    # whose snapshot ID differs from the cached one.
+    create_tables(connection)
+
+    snapshots = cached_snapshot_ids(connection, (playlist['id'] for playlist in playlists))
+    stale = [playlist for playlist in playlists if snapshots.get(playlist['id']) != playlist['snapshot_id']]
+    if not stale:
+        return 0
+
+    print(f"Downloading {len(stale)} changed playlists out of {len(playlists)}.")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fetched = executor.map(
+            lambda playlist: fetch_playlist_track_ids(spotify_client, playlist['id'], workers=workers),
+            stale
+        )
+        for playlist, track_ids in zip(stale, fetched):
+            store_playlist(connection, playlist['id'], playlist['snapshot_id'], track_ids)
+
+    return len(stale)
+
+
+def get_playlists_track_ids(spotify_client, connection, playlist_ids, workers=DEFAULT_WORKERS):
+    # Returns the track IDs of every given playlist, in the same order. Only the snapshot IDs
+    # are requested for all of them, the contents are downloaded only for changed playlists.
+    playlist_ids = list(playlist_ids)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        snapshots = list(executor.map(
+            lambda playlist_id: spotify_client.playlist(playlist_id, fields='snapshot_id')['snapshot_id'],
+            playlist_ids
+        ))
+
+    playlists = [
+        {'id': playlist_id, 'snapshot_id': snapshot_id}
+        for playlist_id, snapshot_id in dict(zip(playlist_ids, snapshots)).items()
+    ]
+    refresh_playlists(spotify_client, connection, playlists, workers=workers)
+
+    return [load_cached_track_ids(connection, playlist_id) for playlist_id in playlist_ids]
+
+
+def playlists_containing(connection, playlist_ids, track_ids):
+    # Returns {playlist ID: set of the given track IDs it contains} for the given playlists.
+    playlist_ids = set(playlist_ids)
+    track_ids = list(dict.fromkeys(track_ids))
+    containing = {}
+    for i in range(0, len(track_ids), MAX_IDS_PER_QUERY):
+        chunk = track_ids[i:i + MAX_IDS_PER_QUERY]
+        rows = connection.execute(
+            f'SELECT DISTINCT playlist_id, track_id FROM playlist_tracks '
+            f'WHERE track_id IN ({", ".join("?" * len(chunk))})',
+            chunk
+        )
+        for playlist_id, track_id in rows:
+            if playlist_id in playlist_ids:
+                containing.setdefault(playlist_id, set()).add(track_id)
+
+    return containing
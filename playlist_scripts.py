@@ -0,0 +1,58 @@
+import argparse
+import importlib
+import os
+import sys
+
+
+# Subcommands and the scripts that run them. Only the script of the chosen subcommand is imported,
+# so e.g. merge does not wait for numpy, and --help does not wait for spotipy.
+COMMANDS = {
+    'years': ('liked_by_album_released_years', 'Creates playlists of liked songs by album release years.'),
+    'audio-features': ('by_audio_features', 'Creates playlists of tracks by their audio features.'),
+    'merge': ('merge_playlists', 'Merges playlists into a new or an existing playlist.'),
+    'delete': ('delete_tracks_from_all_playlists', 'Deletes tracks from all playlists of the user.'),
+}
+
+
+def get_args(argv=None):
+    # Only the subcommand is parsed here, the rest of the arguments are parsed by its script.
+    parser = argparse.ArgumentParser(
+        description='Runs a playlist script. Use <command> --help for the arguments of a command.',
+        add_help=True
+    )
+    subparsers = parser.add_subparsers(dest='command', metavar='command', required=True)
+    for command, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(command, help=help_text, add_help=False)
+
+    args, script_argv = parser.parse_known_args(argv)
+    args.script_argv = script_argv
+    return args
+
+
+def main(args):
+    script = importlib.import_module(COMMANDS[args.command][0])
+    script_args = script.get_args(args.script_argv, prog=f"{os.path.basename(sys.argv[0])} {args.command}")
+
+    # Imported after the script, which has already imported spotipy through them.
+    from spotify_api import create_spotify_client, cached_user_token
+    from local_cache import open_cache
+    from profile_cache import get_profile
+    from metrics import DEFAULT_METRICS
+
+    # The token is read from the token cache file and the profile from the local cache, so the
+    # first request to Spotify is already part of the script's work.
+    spotify_client = create_spotify_client(script.PERMISSIONS_SCOPE)
+    cache_connection = open_cache(script_args.cache_path)
+    try:
+        current_user = get_profile(spotify_client, cache_connection, cached_user_token(spotify_client))
+    finally:
+        cache_connection.close()
+
+    try:
+        script.main(script_args, spotify_client=spotify_client, current_user=current_user)
+    finally:
+        DEFAULT_METRICS.export(script_args.metrics_json, script_args.metrics_prometheus)
+
+
+if __name__ == '__main__':
+    main(get_args())
@@ -0,0 +1,49 @@
+from pagination import DEFAULT_WORKERS
+from playlist_cache import get_playlists_track_ids, cached_snapshot_ids, store_playlist
+
+
+# Maximum amount of tracks per add or removal request.
+MAX_TRACKS_PER_REQUEST = 100
+
+
+def diff_playlist(current_track_ids, desired_track_ids):
+    # Returns the track IDs to remove and to add (in the desired order), so that
+    # the playlist contains exactly the desired tracks. Tracks that stay are not moved.
+    desired = dict.fromkeys(desired_track_ids)
+    current = set(current_track_ids)
+    to_remove = list(dict.fromkeys(track_id for track_id in current_track_ids if track_id not in desired))
+    to_add = [track_id for track_id in desired if track_id not in current]
+    return to_remove, to_add
+
+
+def sync_playlist(spotify_client, connection, playlist_id, desired_track_ids, workers=DEFAULT_WORKERS):
+    # Makes an existing playlist contain the desired tracks with the least amount of requests.
+    # The current contents come from the local playlist cache, so an unchanged playlist is not downloaded.
+    # Returns the amount of removed and added tracks.
+    current_track_ids = get_playlists_track_ids(spotify_client, connection, [playlist_id], workers=workers)[0]
+    snapshot_id = cached_snapshot_ids(connection, [playlist_id])[playlist_id]
+    to_remove, to_add = diff_playlist(current_track_ids, desired_track_ids)
+    print(f"Syncing playlist {playlist_id}: removing {len(to_remove)} and adding {len(to_add)} tracks.")
+
+    # Removals are applied to the snapshot that the diff was made from, every response gives the snapshot for the
+    # next one. Spotify does not take a snapshot ID for additions, they are appended to the end of the playlist.
+    for i in range(0, len(to_remove), MAX_TRACKS_PER_REQUEST):
+        result = spotify_client.playlist_remove_all_occurrences_of_items(
+            playlist_id, to_remove[i:i + MAX_TRACKS_PER_REQUEST], snapshot_id=snapshot_id
+        )
+        snapshot_id = result['snapshot_id']
+
+    for i in range(0, len(to_add), MAX_TRACKS_PER_REQUEST):
+        result = spotify_client.playlist_add_items(playlist_id, to_add[i:i + MAX_TRACKS_PER_REQUEST])
+        snapshot_id = result['snapshot_id']
+
+    # The cache mirrors the written contents, so the next sync does not download the playlist again.
+    removed = set(to_remove)
+    store_playlist(
+        connection,
+        playlist_id,
+        snapshot_id,
+        [track_id for track_id in current_track_ids if track_id not in removed] + to_add
+    )
+
+    return len(to_remove), len(to_add)
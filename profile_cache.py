@@ -0,0 +1,44 @@
+import hashlib
+import json
+import time
+
+
+# Cached profiles are loaded again after this many seconds, e.g. to pick up a changed display name.
+PROFILE_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def create_tables(connection):
+    with connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS profiles ('
+            'token_key TEXT PRIMARY KEY, '  # Hash of the token that the profile belongs to.
+            'profile TEXT NOT NULL, '  # JSON object, as returned by the current user's profile endpoint.
+            'loaded_at REAL NOT NULL)'
+        )
+
+
+def _token_key(user_token):
+    # Only a hash is stored, the token itself stays in the token cache file.
+    return hashlib.sha1(user_token.encode()).hexdigest()
+
+
+def get_profile(spotify_client, connection, user_token, max_age=PROFILE_MAX_AGE):
+    # Returns the profile of the user that the token belongs to. It is only requested from Spotify when it is
+    # not cached yet, so the first request of a run is not spent on it. Without a token nothing is cached.
+    create_tables(connection)
+    if user_token:
+        row = connection.execute(
+            'SELECT profile, loaded_at FROM profiles WHERE token_key = ?', (_token_key(user_token),)
+        ).fetchone()
+        if row and time.time() - row[1] < max_age:
+            return json.loads(row[0])
+
+    profile = spotify_client.me()
+    if user_token and profile:
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)',
+                (_token_key(user_token), json.dumps(profile), time.time())
+            )
+
+    return profile
@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from spotipy.exceptions import SpotifyException
+from metrics import DEFAULT_METRICS
+
+
+# Writes are served before reads when both are waiting for a free slot.
+WRITE_PRIORITY, READ_PRIORITY = 0, 1
+
+DEFAULT_RATE = float(os.environ.get('SPOTIFY_REQUEST_RATE', 20.0))  # Requests per second.
+DEFAULT_BURST = 20
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_RETRIES = 5
+
+# Concurrency limit grows by this much per successful request and halves on 429 or 5xx responses.
+CONCURRENCY_INCREASE = 0.25
+SERVER_ERROR_BACKOFF = 0.5  # Seconds, doubled for every retry.
+
+
+class RequestScheduler:
+    # Coordinates every Spotify API request of the process:
+    # a token bucket limits the request rate and is paused for the Retry-After duration of 429 responses,
+    # and an adaptive concurrency limit with priority ordering decides which request is sent next.
+
+    def __init__(
+        self,
+        rate=DEFAULT_RATE,
+        burst=DEFAULT_BURST,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        min_concurrency=DEFAULT_MIN_CONCURRENCY,
+        max_retries=DEFAULT_MAX_RETRIES,
+        metrics=None
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.metrics = metrics
+
+        self.concurrency = float(max(min_concurrency, max_concurrency // 2))
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+
+        self._bucket_lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def _acquire_slot(self, priority):
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            while self._waiting[0] != ticket or self._in_flight >= int(self.concurrency):
+                self._condition.wait()
+
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            self._condition.notify_all()
+
+    def _release_slot(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _acquire_token(self):
+        while True:
+            with self._bucket_lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                    self._refilled_at = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+    def _pause(self, seconds):
+        with self._bucket_lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def _on_success(self):
+        with self._condition:
+            self.concurrency = min(self.max_concurrency, self.concurrency + CONCURRENCY_INCREASE)
+            self._condition.notify_all()
+
+    def _on_overload(self):
+        with self._condition:
+            self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+
+    def _should_retry(self, error, attempt):
+        if error.http_status != 429 and not 500 <= error.http_status < 600:
+            return False
+        return attempt < self.max_retries
+
+    def call(self, priority, request):
+        attempt = 0
+        while True:
+            self._acquire_slot(priority)
+            try:
+                self._acquire_token()
+                result = request()
+                retry_error = None
+            except SpotifyException as error:
+                if not self._should_retry(error, attempt):
+                    raise
+                retry_error = error
+            finally:
+                self._release_slot()
+
+            if retry_error is None:
+                self._on_success()
+                return result
+
+            self._on_overload()
+            if self.metrics:
+                self.metrics.record_retry(retry_error.http_status)
+            if retry_error.http_status == 429:
+                retry_after = int(retry_error.headers.get('Retry-After', 1))
+                print(f"Rate limited by Spotify, waiting {retry_after} seconds.")
+                if self.metrics:
+                    self.metrics.record_rate_limit_wait(retry_after)
+                self._pause(retry_after)
+            else:
+                time.sleep(SERVER_ERROR_BACKOFF * 2 ** attempt)
+            attempt += 1
+
+
+DEFAULT_SCHEDULER = RequestScheduler(metrics=DEFAULT_METRICS)
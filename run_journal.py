@@ -0,0 +1,94 @@
+import hashlib
+import json
+from local_cache import open_cache
+
+
+def create_tables(connection):
+    with connection:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS run_journal ('
+            'run_key TEXT PRIMARY KEY, '
+            'state TEXT NOT NULL, '  # JSON object.
+            'updated_at TEXT DEFAULT CURRENT_TIMESTAMP)'
+        )
+        # Large values that are written once, e.g. the tracks to add, so checkpoints stay small.
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS run_journal_data ('
+            'run_key TEXT NOT NULL, '
+            'name TEXT NOT NULL, '
+            'data TEXT NOT NULL, '  # JSON.
+            'PRIMARY KEY (run_key, name))'
+        )
+
+
+def run_key(script, user_id, work_args):
+    # A run is identified by the script, the user and the arguments that decide what it does.
+    return hashlib.sha1(json.dumps([script, user_id, work_args], sort_keys=True).encode()).hexdigest()
+
+
+class RunJournal:
+    # Checkpoints of a run that has not finished yet, kept in the local cache database, so that
+    # a --resume run of the same command continues from the last checkpoint instead of starting over.
+    # It has its own connection, so checkpoints can be written while other threads use the cache.
+
+    def __init__(self, cache_path, script, user_id, work_args, resume=False):
+        self.connection = open_cache(cache_path)
+        self.key = run_key(script, user_id, work_args)
+        create_tables(self.connection)
+
+        self.state = {}
+        if resume:
+            row = self.connection.execute('SELECT state FROM run_journal WHERE run_key = ?', (self.key,)).fetchone()
+            if row:
+                self.state = json.loads(row[0])
+                print("Resuming the previous run.")
+            else:
+                print("No unfinished run to resume - starting a new run.")
+        else:
+            # A new run makes the checkpoints of an unfinished earlier run useless.
+            self._delete()
+
+        self.resumed = bool(self.state)
+
+    def _delete(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM run_journal WHERE run_key = ?', (self.key,))
+            self.connection.execute('DELETE FROM run_journal_data WHERE run_key = ?', (self.key,))
+
+    def get(self, name, default=None):
+        return self.state.get(name, default)
+
+    def checkpoint(self, **values):
+        self.state.update(values)
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO run_journal (run_key, state) VALUES (?, ?)', (self.key, json.dumps(self.state))
+            )
+
+    def store(self, name, value):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO run_journal_data VALUES (?, ?, ?)', (self.key, name, json.dumps(value))
+            )
+
+    def load(self, name, default=None):
+        row = self.connection.execute(
+            'SELECT data FROM run_journal_data WHERE run_key = ? AND name = ?', (self.key, name)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def finish(self):
+        self._delete()
+        self.connection.close()
+
+
+def committed_tracks(spotify_client, playlist_id, journaled, base_total=0):
+    # The run may have stopped after Spotify added a batch, but before it was journaled. Tracks are only
+    # appended, so the playlist's size tells how many of them were really added.
+    total = spotify_client.playlist(playlist_id, fields='tracks(total)')['tracks']['total']
+    return max(journaled, total - base_total)
+
+
+def add_resume_argument(parser):
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the last unfinished run of the same command, instead of starting over.')
@@ -0,0 +1,54 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from audio_features_cache import AUDIO_FEATURES
+from feature_filter import features_to_matrix
+
+
+# The features that by_audio_features.py has filter flags for.
+SIMILARITY_FEATURES = tuple(feature for feature in AUDIO_FEATURES if feature != 'mode')
+SIMILARITY_COLUMNS = np.array([AUDIO_FEATURES.index(feature) for feature in SIMILARITY_FEATURES], dtype=np.intp)
+
+
+class SimilarityIndex:
+    # KD-tree over the audio features of a library, so the tracks closest to some seed tracks
+    # are found without computing the distance to every track of the library.
+
+    def __init__(self, track_ids, feature_rows):
+        vectors = features_to_matrix(feature_rows)[:, SIMILARITY_COLUMNS]
+        # Tracks without audio features can not be compared, they are left out.
+        available = ~np.isnan(vectors).any(axis=1)
+        self.track_ids = [track_id for track_id, is_available in zip(track_ids, available) if is_available]
+        vectors = vectors[available]
+        if not len(vectors):
+            raise Exception("None of the tracks have audio features.")
+
+        # Features are on very different scales (e.g. tempo and duration_ms versus valence), so every
+        # feature is standardized by the library's own mean and deviation, to weigh all of them equally.
+        self.mean = vectors.mean(axis=0)
+        self.scale = vectors.std(axis=0)
+        self.scale[self.scale == 0] = 1.0
+        self.tree = cKDTree(self.normalize(vectors))
+
+    def normalize(self, vectors):
+        return (vectors - self.mean) / self.scale
+
+    def nearest(self, seed_feature_rows, count, exclude=()):
+        # Returns up to count track IDs, closest to any of the seeds first. Excluded IDs (e.g. the seeds) are skipped.
+        seeds = features_to_matrix(seed_feature_rows)[:, SIMILARITY_COLUMNS]
+        seeds = seeds[~np.isnan(seeds).any(axis=1)]
+        if not len(seeds):
+            raise Exception("None of the seed tracks have audio features.")
+
+        exclude = set(exclude)
+        neighbours = min(count + len(exclude), len(self.track_ids))
+        distances, indexes = self.tree.query(self.normalize(seeds), k=neighbours)
+        distances = np.asarray(distances).reshape(len(seeds), -1)
+        indexes = np.asarray(indexes).reshape(len(seeds), -1)
+
+        closest = {}
+        for distance, index in zip(distances.ravel(), indexes.ravel()):
+            track_id = self.track_ids[index]
+            if track_id not in exclude and distance < closest.get(track_id, np.inf):
+                closest[track_id] = distance
+
+        return sorted(closest, key=closest.get)[:count]
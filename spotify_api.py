@@ -0,0 +1,126 @@
+import os
+import threading
+import spotipy
+import urllib3
+import requests
+import secrets as user_secrets
+from spotipy.cache_handler import CacheFileHandler
+from spotipy.oauth2 import SpotifyOAuth
+from request_scheduler import DEFAULT_SCHEDULER, DEFAULT_MAX_CONCURRENCY, READ_PRIORITY, WRITE_PRIORITY
+from metrics import DEFAULT_METRICS
+
+
+# Used to point the scripts to another API server with a fixed access token, e.g. for benchmarks.
+API_URL = os.environ.get('SPOTIFY_API_URL')
+ACCESS_TOKEN = os.environ.get('SPOTIFY_ACCESS_TOKEN')
+
+
+def create_http_adapter(retries=spotipy.Spotify.max_retries, backoff_factor=0.3, pool_size=DEFAULT_MAX_CONCURRENCY):
+    # Retrying on 429 and 5xx responses is left to the scheduler, so that a rate limit
+    # pauses every request instead of stalling a single one. Connection errors are still retried here.
+    retry = urllib3.Retry(
+        total=retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=0,
+        backoff_factor=backoff_factor,
+        status_forcelist=(),
+        respect_retry_after_header=False
+    )
+    # The pool holds a connection for every request that the scheduler lets run at once.
+    return requests.adapters.HTTPAdapter(max_retries=retry, pool_maxsize=pool_size)
+
+
+class TokenCache(CacheFileHandler):
+    # Keeps the token of a user in memory, the file is only read once and written when the token is refreshed.
+
+    def __init__(self, username=None):
+        super().__init__(username=username)
+        self._lock = threading.Lock()
+        self._token_info = None
+
+    def get_cached_token(self):
+        with self._lock:
+            if self._token_info is None:
+                self._token_info = super().get_cached_token()
+            return self._token_info
+
+    def save_token_to_cache(self, token_info):
+        with self._lock:
+            self._token_info = token_info
+            super().save_token_to_cache(token_info)
+
+
+class ScheduledSpotify(spotipy.Spotify):
+    # Spotify client that sends every request through a RequestScheduler and records every response to Metrics.
+    # Clients that are given the same HTTP adapter share its connection pool.
+
+    def __init__(self, *args, scheduler=DEFAULT_SCHEDULER, metrics=DEFAULT_METRICS, adapter=None, **kwargs):
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.adapter = adapter
+        super().__init__(*args, **kwargs)
+
+    def _record_response(self, response, *args, **kwargs):
+        self.metrics.record_response(
+            response.request.method,
+            response.url,
+            response.status_code,
+            response.elapsed.total_seconds(),
+            len(response.content)
+        )
+
+    def _build_session(self):
+        self._session = requests.Session()
+        adapter = self.adapter or create_http_adapter(self.retries, self.backoff_factor)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.hooks['response'].append(self._record_response)
+
+    def _internal_call(self, method, url, payload, params):
+        priority = READ_PRIORITY if method == 'GET' else WRITE_PRIORITY
+        # The parent call modifies params, so every attempt gets its own copy.
+        return self.scheduler.call(
+            priority,
+            lambda: super(ScheduledSpotify, self)._internal_call(method, url, payload, dict(params))
+        )
+
+
+def create_authorization(scope, username=None):
+    # Tokens of every user are cached in their own file: .cache or .cache-<username>.
+    return SpotifyOAuth(
+        scope=scope,
+        client_id=user_secrets.CLIENT_ID,
+        client_secret=user_secrets.CLIENT_SECRET,
+        redirect_uri=user_secrets.REDIRECT_URI,
+        open_browser=False,
+        cache_handler=TokenCache(username=username)
+    )
+
+
+def cached_user_token(spotify_client):
+    # Identifies the authorized user without sending a request: the fixed access token, or the refresh token
+    # of the cached token, which stays the same when the access token is refreshed. None before authorization.
+    if ACCESS_TOKEN:
+        return ACCESS_TOKEN
+    token_info = spotify_client.auth_manager.cache_handler.get_cached_token()
+    return token_info.get('refresh_token') if token_info else None
+
+
+def create_spotify_client(scope, scheduler=DEFAULT_SCHEDULER, metrics=DEFAULT_METRICS, adapter=None,
+                          authorization=None):
+    if ACCESS_TOKEN:
+        spotify_client = ScheduledSpotify(auth=ACCESS_TOKEN, scheduler=scheduler, metrics=metrics, adapter=adapter)
+    else:
+        spotify_client = ScheduledSpotify(
+            auth_manager=authorization or create_authorization(scope),
+            scheduler=scheduler,
+            metrics=metrics,
+            adapter=adapter
+        )
+
+    if API_URL:
+        spotify_client.prefix = API_URL.rstrip('/') + '/'
+
+    return spotify_client
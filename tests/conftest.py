@@ -0,0 +1,40 @@
+import os
+import sys
+import threading
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+from mock_spotify_server import MockLibrary, create_server, ACCESS_TOKEN  # noqa: E402
+from request_scheduler import RequestScheduler  # noqa: E402
+from spotify_api import ScheduledSpotify  # noqa: E402
+
+
+@pytest.fixture
+def start_server():
+    # Starts mock Spotify API servers, which are shut down after the test.
+    servers = []
+
+    def start(library=None, **kwargs):
+        server = create_server(library or MockLibrary(100, 2, 10), **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def create_client():
+    # Creates Spotify clients for a mock server, with their own scheduler and metrics.
+    def create(server, metrics):
+        spotify_client = ScheduledSpotify(
+            auth=ACCESS_TOKEN, scheduler=RequestScheduler(rate=1000.0, metrics=metrics), metrics=metrics
+        )
+        spotify_client.prefix = 'http://%s:%d/v1/' % server.server_address
+        return spotify_client
+
+    return create
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from audio_features_cache import AUDIO_FEATURES
+from feature_filter import FEATURE_COLUMNS, compile_filters, evaluate_filters, features_to_matrix
+
+
+def features(**values):
+    # A feature row in AUDIO_FEATURES order, every feature that is not given is 0.5.
+    return tuple(values.get(feature, 0.5) for feature in AUDIO_FEATURES)
+
+
+def test_compile_filters_splits_multi_word_features_once():
+    compiled = compile_filters({'min_duration_ms': 120000, 'max_time_signature': 4})
+
+    assert list(compiled.columns) == sorted([FEATURE_COLUMNS['duration_ms'], FEATURE_COLUMNS['time_signature']])
+    bounds = dict(zip((AUDIO_FEATURES[column] for column in compiled.columns), zip(compiled.lower, compiled.upper)))
+    assert bounds == {'duration_ms': (120000, np.inf), 'time_signature': (-np.inf, 4)}
+
+
+@pytest.mark.parametrize('key', ['min_duration', 'avg_tempo', 'tempo', 'max_'])
+def test_compile_filters_rejects_unknown_keys(key):
+    with pytest.raises(Exception, match=f"Unknown audio feature filter: {key}"):
+        compile_filters({key: 1})
+
+
+def test_min_and_max_bound_on_the_same_column():
+    compiled = compile_filters({'min_tempo': 100, 'max_tempo': 140})
+    rows = [features(tempo=tempo) for tempo in (99.9, 100, 120, 140, 140.1)]
+
+    assert evaluate_filters([compiled], features_to_matrix(rows))[0].tolist() == [False, True, True, True, False]
+
+
+def test_missing_features_never_pass():
+    compiled = [compile_filters({'min_energy': 0.0}), compile_filters({'max_tempo': 1000})]
+    # A track without any audio features, and one that is only missing the filtered energy.
+    rows = [features(energy=0.9), None, features(energy=None)]
+
+    masks = evaluate_filters(compiled, features_to_matrix(rows))
+    assert masks.tolist() == [[True, False, False], [True, False, True]]
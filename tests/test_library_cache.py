@@ -0,0 +1,77 @@
+import pytest
+from mock_spotify_server import MockLibrary, track_id
+from local_cache import open_cache
+from library_cache import sync_saved_tracks, load_saved_track_ids
+from metrics import Metrics
+
+USER_ID = 'benchmark_user'
+
+
+def saved_track_ids(track_count):
+    # The mock server returns the most recently generated track first.
+    return [track_id(number) for number in range(track_count - 1, -1, -1)]
+
+
+def saved_tracks_requests(metrics):
+    return metrics.to_dict()['endpoints']['GET me/tracks']['requests']
+
+
+@pytest.fixture
+def library_session(start_server, create_client, tmp_path):
+    library = MockLibrary(500, 0)
+    metrics = Metrics()
+    spotify_client = create_client(start_server(library), metrics)
+    connection = open_cache(tmp_path / 'cache.sqlite3')
+    assert sync_saved_tracks(spotify_client, connection, USER_ID) == 500
+    return library, metrics, spotify_client, connection
+
+
+def test_incremental_sync_stops_at_the_first_known_track(library_session):
+    library, metrics, spotify_client, connection = library_session
+    library.track_count = 530
+    requests = saved_tracks_requests(metrics)
+
+    assert sync_saved_tracks(spotify_client, connection, USER_ID) == 530
+    # The 30 new tracks and the first known one are all on the first page.
+    assert saved_tracks_requests(metrics) == requests + 1
+    assert load_saved_track_ids(connection, USER_ID) == saved_track_ids(530)
+
+
+def test_removed_tracks_download_the_whole_library(library_session):
+    library, metrics, spotify_client, connection = library_session
+    library.track_count = 480  # The 20 newest tracks are unliked.
+    requests = saved_tracks_requests(metrics)
+
+    assert sync_saved_tracks(spotify_client, connection, USER_ID) == 480
+    # One page to notice the difference, then every page of the full download.
+    assert saved_tracks_requests(metrics) == requests + 1 + 10
+    assert load_saved_track_ids(connection, USER_ID) == saved_track_ids(480)
+
+
+def test_interrupted_full_download_continues_from_the_last_page(start_server, create_client, tmp_path):
+    library = MockLibrary(500, 0)
+    server = start_server(library)
+    connection = open_cache(tmp_path / 'cache.sqlite3')
+
+    failing_client = create_client(server, Metrics())
+    request_page = failing_client.current_user_saved_tracks
+    calls = []
+
+    def fail_after_four_pages(*args, **kwargs):
+        calls.append(kwargs)
+        if len(calls) > 4:
+            raise ConnectionError("simulated network error")
+        return request_page(*args, **kwargs)
+
+    failing_client.current_user_saved_tracks = fail_after_four_pages
+    with pytest.raises(ConnectionError):
+        sync_saved_tracks(failing_client, connection, USER_ID, workers=1)
+    next_offset, = connection.execute('SELECT next_offset FROM saved_tracks_download').fetchone()
+    assert next_offset >= 200
+
+    metrics = Metrics()
+    assert sync_saved_tracks(create_client(server, metrics), connection, USER_ID) == 500
+    # The first page is requested by the incremental sync and again to check that the library did not change.
+    assert saved_tracks_requests(metrics) == 2 + (500 - next_offset) // 50
+    assert load_saved_track_ids(connection, USER_ID) == saved_track_ids(500)
+    assert connection.execute('SELECT COUNT(*) FROM saved_tracks_download').fetchone()[0] == 0
@@ -0,0 +1,50 @@
+import http.client
+import json
+import pytest
+from mock_spotify_server import MockLibrary, ACCESS_TOKEN, track_id
+from local_cache import open_cache
+from metrics import Metrics
+from playlist_sync import sync_playlist
+
+
+def connect(server):
+    return http.client.HTTPConnection(*server.server_address, timeout=5)
+
+
+def request(connection, method, path, body=None, token=ACCESS_TOKEN):
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+@pytest.mark.parametrize('token, rate_limit_probability, status', [
+    ('invalid-token', 0.0, 401),
+    (ACCESS_TOKEN, 1.0, 429),
+])
+def test_early_response_keeps_connection_usable(start_server, token, rate_limit_probability, status):
+    # The body of a request that gets an early error response has to be read,
+    # otherwise it is parsed as the start of the next request on the same connection.
+    connection = connect(start_server(rate_limit_probability=rate_limit_probability))
+    body = {'uris': [f'spotify:track:{"x" * 22}'] * 50}
+    assert request(connection, 'POST', '/v1/playlists/any/tracks', body, token=token)[0] == status
+    assert request(connection, 'GET', '/v1/me', token=token)[0] == status
+
+
+def test_second_sync_of_a_playlist_writes_nothing(start_server, create_client, tmp_path):
+    library = MockLibrary(100, 1, 30)
+    metrics = Metrics()
+    spotify_client = create_client(start_server(library), metrics)
+    connection = open_cache(tmp_path / 'cache.sqlite3')
+    playlist_id, playlist = next(iter(library.playlists.items()))
+    missing = [track_id(number) for number in range(100) if track_id(number) not in playlist['tracks']]
+    desired = playlist['tracks'][10:] + missing
+
+    assert sync_playlist(spotify_client, connection, playlist_id, desired) == (10, 70)
+    assert sorted(playlist['tracks']) == sorted(desired)
+
+    # Only the snapshot ID is requested, the unchanged contents come from the cache and nothing is written.
+    requests = metrics.to_dict()['requests']
+    assert sync_playlist(spotify_client, connection, playlist_id, desired) == (0, 0)
+    assert metrics.to_dict()['requests'] == requests + 1
+    assert metrics.to_dict()['endpoints']['GET playlists/{id}']['requests'] == 2
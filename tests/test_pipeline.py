@@ -0,0 +1,66 @@
+import threading
+import pytest
+from pipeline import run_pipeline
+
+
+def test_passes_items_through_every_stage():
+    written = []
+
+    def double(items):
+        for item in items:
+            yield item * 2
+
+    def write(items):
+        written.extend(items)
+        return ()
+
+    run_pipeline(range(5), double, write)
+    assert written == [0, 2, 4, 6, 8]
+
+
+@pytest.mark.parametrize('item_count', [3, 50])
+def test_failing_last_stage_is_raised(item_count):
+    # The last stage is a plain function like write_stage of by_audio_features.py. With more items than
+    # the queues hold, the first stage has to be stopped as well instead of waiting on a full queue.
+    def write(items):
+        for item in items:
+            raise ConnectionError(f"failed to write {item}")
+        return ()
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(_raised(run_pipeline, range(item_count), write)))
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive(), "run_pipeline did not stop"
+    assert isinstance(result[0], ConnectionError)
+
+
+def _raised(function, *args):
+    try:
+        function(*args)
+    except Exception as error:
+        return error
+    return None
+
+
+def test_failing_upstream_stage_skips_end_of_input_of_later_stages():
+    # Like an audio features request failing in filter_stage of by_audio_features.py: the write stage
+    # must not flush its partial batch, as if its input had ended normally.
+    flushed = []
+
+    def filter_items(items):
+        for item in items:
+            if item == 3:
+                raise ConnectionError("failed to filter")
+            yield item
+
+    def write(items):
+        batch = list(items)
+        flushed.append(batch)
+        return ()
+
+    with pytest.raises(ConnectionError):
+        run_pipeline(range(10), filter_items, write)
+    assert flushed == []
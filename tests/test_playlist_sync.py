@@ -0,0 +1,24 @@
+from playlist_sync import diff_playlist
+
+
+def test_diff_playlist_removes_and_adds_only_the_differences():
+    current = ['a', 'b', 'a', 'c', 'd', 'b']
+    desired = ['c', 'e', 'a', 'e', 'f']
+
+    to_remove, to_add = diff_playlist(current, desired)
+
+    # Every track is removed or added once, no matter how often it is listed.
+    assert to_remove == ['b', 'd']
+    assert to_add == ['e', 'f']
+
+
+def test_diff_playlist_keeps_tracks_that_stay_in_place():
+    current = ['a', 'b', 'c']
+    desired = ['c', 'b', 'a', 'd']
+
+    # Tracks that stay are not moved to the desired order, new tracks are appended.
+    assert diff_playlist(current, desired) == ([], ['d'])
+
+
+def test_diff_playlist_of_an_unchanged_playlist_is_empty():
+    assert diff_playlist(['a', 'b'], ['a', 'b']) == ([], [])
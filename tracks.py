@@ -0,0 +1,34 @@
+import sys
+
+
+class Track:
+    # Compact record of a track, holding only the fields that the scripts use.
+    # Slots avoid a per instance dict, which matters when 100k+ tracks are held in memory.
+    __slots__ = ('id', 'name', 'artist_name', 'artist_ids', 'release_date', 'added_at')
+
+    def __init__(self, id, name, artist_name, artist_ids, release_date, added_at=None):
+        self.id = id
+        self.name = name
+        # Artist names and release dates repeat a lot within a library, so equal strings are shared.
+        self.artist_name = sys.intern(artist_name) if artist_name else artist_name
+        self.artist_ids = artist_ids  # Comma separated.
+        self.release_date = sys.intern(release_date) if release_date else release_date
+        self.added_at = added_at
+
+    @classmethod
+    def from_item(cls, item):
+        # Parses a saved track or playlist item of the API, the rest of the item is not kept.
+        track = item['track']
+        artists = track.get('artists') or [{'id': None, 'name': None}]
+        album = track.get('album') or {}
+        return cls(
+            track['id'],
+            track.get('name'),
+            artists[0]['name'],
+            ",".join(artist['id'] for artist in artists if artist['id']),
+            album.get('release_date'),
+            item.get('added_at'),
+        )
+
+    def __repr__(self):
+        return f'Track(id={self.id!r}, name={self.name!r}, artist_name={self.artist_name!r})'
@@ -0,0 +1,34 @@
+from bisect import bisect_left, bisect_right
+
+
+def release_year(release_date):
+    # Expected formats: 2020-01-01, 2020-01, 2020
+    try:
+        return int(release_date.split("-")[0])
+    except Exception:
+        return None
+
+
+class ReleaseYearIndex:
+    # Track positions sorted by album release year, so that the tracks of any
+    # year range are found with a binary search instead of a scan of the whole library.
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+        # Release dates are parsed once per track, not once per track and range. Tracks without a year are left out.
+        keyed = sorted(
+            (year, position) for position, year in enumerate(release_year(track.release_date) for track in tracks)
+            if year is not None
+        )
+        self.years = [year for year, _ in keyed]
+        self.positions = [position for _, position in keyed]
+
+    def tracks_between(self, start_year, end_year):
+        # Returns the tracks released from start_year to end_year (both included), in their original order.
+        start = bisect_left(self.years, start_year)
+        end = bisect_right(self.years, end_year)
+        return [self.tracks[position] for position in sorted(self.positions[start:end])]
+
+    def decades(self):
+        # Returns the (start year, end year) of every decade that has tracks.
+        return [(decade, decade + 9) for decade in sorted({year // 10 * 10 for year in self.years})]